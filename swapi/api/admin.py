@@ -1,13 +1,119 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-from api.models import People, Planet
+from api.bulk import bulk_delete_people, bulk_update_people
+from api.models import Film, People, Planet, Species, Starship, Vehicle
+
+
+def estimate_row_count(model, using):
+    """
+    Cheap row count estimate for `model`'s table, without a `COUNT(*)`: the
+    highest id, a lookup at the end of the primary key index. It can only
+    overestimate, so every row stays reachable from the pagination. (The
+    `ANALYZE` statistics could undercount, as they are only refreshed by
+    the next `ANALYZE`.)
+    """
+    table = model._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT MAX({0}) FROM {1}'.format(
+            connections[using].ops.quote_name(model._meta.pk.column),
+            connections[using].ops.quote_name(table)))
+        return cursor.fetchone()[0] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses an estimate for the unfiltered changelist, where an exact
+    `COUNT(*)` would scan the whole table. Filtered lists are counted.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimate_row_count(queryset.model, queryset.db)
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    ordering = ('id',)  # pages of an unordered queryset can skip or repeat rows
+    show_full_result_count = False  # avoids another COUNT(*)
+
+    # Searched with an index range scan on prefixes, see below
+    prefix_search_field = 'name'
+    search_fields = ('name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Match `search_term` as a case sensitive prefix with `>=`/`<`
+        comparisons, which SQLite answers from the index. The default
+        `icontains` search is a `LIKE '%term%'` that scans every row.
+        """
+        if not search_term:
+            return queryset, False
+        return queryset.filter(**{
+            self.prefix_search_field + '__gte': search_term,
+            self.prefix_search_field + '__lt': search_term + '\U0010ffff',
+        }), False
+
+
+def bulk_delete_selected(modeladmin, request, queryset):
+    deleted = bulk_delete_people(queryset)
+    modeladmin.message_user(request, 'Deleted {} people.'.format(deleted), messages.SUCCESS)
+bulk_delete_selected.short_description = 'Delete selected people (single statement)'
+
+
+def make_hair_color_action(value, label):
+    def action(modeladmin, request, queryset):
+        updated = bulk_update_people(queryset, hair_color=value)
+        modeladmin.message_user(request, 'Updated {} people.'.format(updated), messages.SUCCESS)
+    action.__name__ = 'set_hair_color_{}'.format(value or 'none')
+    action.short_description = 'Set hair color of selected people to {}'.format(label)
+    return action
 
 
 @admin.register(People)
-class PeopleAdmin(admin.ModelAdmin):
-    pass
+class PeopleAdmin(ScalableAdmin):
+    list_display = ('name', 'homeworld', 'height', 'mass', 'hair_color', 'created')
+    list_select_related = ('homeworld',)
+    list_filter = ('hair_color',)
+    autocomplete_fields = ('homeworld', 'films', 'species', 'vehicles', 'starships')
+    actions = [bulk_delete_selected] + [
+        make_hair_color_action(value, label)
+        for value, label in People.HAIR_COLOR_CHOICES + ((None, 'None'),)
+    ]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Replaced by `bulk_delete_selected`, which doesn't load every row
+        actions.pop('delete_selected', None)
+        return actions
 
 
 @admin.register(Planet)
-class PlanetAdmin(admin.ModelAdmin):
+class PlanetAdmin(ScalableAdmin):
+    list_display = ('name', 'population', 'diameter')
+
+
+@admin.register(Film)
+class FilmAdmin(ScalableAdmin):
+    prefix_search_field = 'title'
+    search_fields = ('title',)
+
+
+@admin.register(Species)
+class SpeciesAdmin(ScalableAdmin):
+    pass
+
+
+@admin.register(Vehicle)
+class VehicleAdmin(ScalableAdmin):
+    pass
+
+
+@admin.register(Starship)
+class StarshipAdmin(ScalableAdmin):
     pass
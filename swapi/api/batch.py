@@ -0,0 +1,130 @@
+import io
+import json
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+
+
+# Not inherited by sub-requests: they have their own JSON body and response,
+# and the batch's idempotency key applies to the batch as a whole.
+EXCLUDED_ENVIRON = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT', 'HTTP_IDEMPOTENCY_KEY')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Sub-requests only reach the API views: others (e.g. the admin) rely on
+# middleware that isn't run for them
+BATCH_URLCONF = 'api.urls'
+
+
+class BatchError(Exception):
+    """Raised when the batch payload itself is malformed."""
+
+
+def parse_subrequests(payload, max_requests):
+    """
+    Validate the batch payload, either a bare list of sub-requests or an
+    object `{"atomic": bool, "requests": [...]}`. Returns `(requests, atomic)`.
+    """
+    atomic = False
+    if isinstance(payload, dict):
+        atomic = bool(payload.get('atomic', False))
+        payload = payload.get('requests')
+    if not isinstance(payload, list) or not payload:
+        raise BatchError('Provide a non-empty list of requests')
+    if len(payload) > max_requests:
+        raise BatchError('Too many requests in batch (max {})'.format(max_requests))
+
+    subrequests = []
+    for item in payload:
+        if not isinstance(item, dict):
+            raise BatchError('Each request must be a JSON object')
+        method = item.get('method', 'GET')
+        path = item.get('path')
+        if not isinstance(method, str) or not isinstance(path, str) or not path.startswith('/'):
+            raise BatchError('Each request needs a `method` and an absolute `path`')
+        subrequests.append((method.upper(), path, item.get('body')))
+    return subrequests, atomic
+
+
+def build_subrequest(parent, method, path, body):
+    """
+    Build a request for `path` that shares the parent's client metadata
+    (host, remote address, headers) but has its own method and body.
+    """
+    url = urlsplit(path)
+    data = b'' if body is None else json.dumps(body).encode('utf-8')
+    environ = {
+        key: value for key, value in parent.META.items()
+        if not key.startswith('wsgi.') and key not in EXCLUDED_ENVIRON
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data),
+        'wsgi.url_scheme': parent.scheme,
+    })
+    return WSGIRequest(environ)
+
+
+def execute_subrequest(parent, method, path, body, excluded_views=()):
+    try:
+        match = resolve(urlsplit(path).path, urlconf=BATCH_URLCONF)
+    except Resolver404:
+        return {'status': 404, 'body': {'msg': 'Not found', 'success': False}}
+    if match.func in excluded_views:
+        return {'status': 400, 'body': {'msg': 'Endpoint can not be batched', 'success': False}}
+
+    request = build_subrequest(parent, method, path, body)
+    response = match.func(request, *match.args, **match.kwargs)
+    try:
+        content = response.content
+    finally:
+        response.close()
+    if response['Content-Type'].startswith('application/json'):
+        content = json.loads(content) if content else None
+    else:
+        content = content.decode(response.charset)
+    return {'status': response.status_code, 'body': content}
+
+
+def execute_batch(parent, subrequests, atomic=False, excluded_views=()):
+    """
+    Run every sub-request in-process and collect their responses.
+
+    When `atomic` is set, all of them run in one transaction: the first
+    sub-request that fails rolls everything back, and the ones after it are
+    skipped with a `424 Failed Dependency` status. The writes made before
+    it are reported as `409 Conflict`, since none of them was kept.
+    """
+    if not atomic:
+        return [execute_subrequest(parent, *sub, excluded_views=excluded_views)
+                for sub in subrequests]
+
+    results = []
+    with transaction.atomic():
+        for sub in subrequests:
+            if results and results[-1]['status'] >= 400:
+                results.append({
+                    'status': 424,
+                    'body': {'msg': 'Skipped after a failed request', 'success': False}
+                })
+                continue
+            results.append(execute_subrequest(parent, *sub, excluded_views=excluded_views))
+        if results[-1]['status'] >= 400:
+            transaction.set_rollback(True)
+            for (method, _, _), result in zip(subrequests, results):
+                if result['status'] >= 400:
+                    break
+                if method not in SAFE_METHODS:
+                    result['status'] = 409
+                    result['body'] = {
+                        'msg': 'Rolled back after a failed request',
+                        'rolled_back': True,
+                        'success': False,
+                    }
+    return results
@@ -0,0 +1,282 @@
+"""
+Micro benchmarks run with `python manage.py benchmark [suite ...]`.
+
+Each suite is a function registered with `@suite(name)` that returns a list
+of `(label, value)` rows, which the command prints as a table.
+"""
+import logging
+import timeit
+from collections import OrderedDict
+
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+
+SUITES = OrderedDict()
+
+
+def suite(name):
+    def decorator(func):
+        SUITES[name] = func
+        return func
+    return decorator
+
+
+def per_call(func, number):
+    """Best of three runs, in microseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def us(value):
+    return '{:.2f} us'.format(value)
+
+
+@suite('ratelimit')
+def bench_ratelimit(number):
+    from api.ratelimit import (
+        CacheBucketStore, ConcurrencyLimiter, MemoryBucketStore, limit_writes)
+
+    memory = MemoryBucketStore()
+    limiter = ConcurrencyLimiter(limit=1, timeout=0)
+
+    def acquire_release():
+        limiter.acquire()
+        limiter.release()
+
+    def view(request):
+        return HttpResponse()
+
+    limited_view = limit_writes('bench')(view)
+    request = RequestFactory().post('/people/')
+    rules = {'bench': {'client': (1e9, 1e9), 'route': (1e9, 1e9)}}
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    with override_settings(CACHES=caches, RATELIMIT_RULES=rules, RATELIMIT_ENABLED=True):
+        cache = CacheBucketStore('default')
+        bare = per_call(lambda: view(request), number)
+        limited = per_call(lambda: limited_view(request), number)
+        return [
+            ('memory bucket take()', us(per_call(lambda: memory.take('k', 1e9, 1e9), number))),
+            ('locmem cache bucket take()', us(per_call(lambda: cache.take('k', 1e9, 1e9), number))),
+            ('write limiter acquire/release', us(per_call(acquire_release, number))),
+            ('limit_writes() overhead per request', us(limited - bare)),
+        ]
+
+
+@suite('serialize')
+def bench_serialize(number):
+    """Serialize a 100k row list, with per-row formatting vs prefix links."""
+    from django.utils import timezone
+
+    from api.links import LinkBuilder
+    from api.models import People
+    from api.serializers import serialize_people_as_json
+
+    now = timezone.now()
+    rows = [People(id=i, name='Person {}'.format(i), homeworld_id=i % 60 + 1,
+                   height=170, mass=70, hair_color='brown', created=now)
+            for i in range(1, 100001)]
+    # As returned by `people_links()`, so the serializer doesn't query
+    related = {
+        'films': {people.id: [1, 2, 3] for people in rows},
+        'species': {people.id: [1] for people in rows},
+        'vehicles': {people.id: [14, 30] for people in rows},
+        'starships': {people.id: [12] for people in rows},
+    }
+    links = LinkBuilder('http://localhost:8000')
+
+    def formatted(people):
+        return {
+            'name': people.name,
+            'homeworld': 'http://localhost:8000/planets/{}/'.format(people.homeworld_id),
+            'height': people.height,
+            'mass': people.mass,
+            'hair_color': people.hair_color,
+            'created': people.created.isoformat(),
+            'url': 'http://localhost:8000/people/{}/'.format(people.id),
+            'films': ['http://localhost:8000/films/{}/'.format(i)
+                      for i in related['films'].get(people.id, ())],
+            'species': ['http://localhost:8000/species/{}/'.format(i)
+                        for i in related['species'].get(people.id, ())],
+            'vehicles': ['http://localhost:8000/vehicles/{}/'.format(i)
+                         for i in related['vehicles'].get(people.id, ())],
+            'starships': ['http://localhost:8000/starships/{}/'.format(i)
+                          for i in related['starships'].get(people.id, ())],
+        }
+
+    before = min(timeit.repeat(lambda: [formatted(p) for p in rows], number=1, repeat=3))
+    after = min(timeit.repeat(
+        lambda: [serialize_people_as_json(p, links, related) for p in rows], number=1, repeat=3))
+    return [
+        ('100k rows, str.format() per link', '{:.1f} ms'.format(before * 1000)),
+        ('100k rows, LinkBuilder prefixes', '{:.1f} ms'.format(after * 1000)),
+    ]
+
+
+@suite('readmodel')
+def bench_readmodel(number):
+    """Memory and read cost of 100k people in the columnar read model."""
+    import tracemalloc
+
+    from django.utils import timezone
+
+    from api.links import LinkBuilder
+    from api.models import People
+    from api.readmodel import PeopleReadModel
+
+    rows_count = 100000
+    now = timezone.now()
+    hair_colors = ('blond', 'black', 'brown', 'red', None)
+
+    def rows():
+        for i in range(1, rows_count + 1):
+            yield (i, 'Person {}'.format(i), i % 60 + 1, 170, 70, hair_colors[i % 5], now)
+
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    instances = [People(id=i, name=name, homeworld_id=homeworld_id, height=height,
+                        mass=mass, hair_color=hair_color, created=created)
+                 for i, name, homeworld_id, height, mass, hair_color, created in rows()]
+    orm_bytes = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(start, 'filename'))
+    del instances
+
+    start = tracemalloc.take_snapshot()
+    model = PeopleReadModel()
+    model.load_rows(rows())
+    model_bytes = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(start, 'filename'))
+    tracemalloc.stop()
+
+    links = LinkBuilder('http://localhost:8000')
+    serialize_all = min(timeit.repeat(lambda: model.filter(links), number=1, repeat=3))
+    filter_one = min(timeit.repeat(lambda: model.filter(links, homeworld_id=7), number=1, repeat=3))
+    return [
+        ('People instances per 100k rows', '{:.1f} MB'.format(orm_bytes / 1e6)),
+        ('read model per 100k rows (tracemalloc)', '{:.1f} MB'.format(model_bytes / 1e6)),
+        ('read model per 100k rows (memory_usage)', '{:.1f} MB'.format(model.memory_usage() / 1e6)),
+        ('serialize 100k rows', '{:.1f} ms'.format(serialize_all * 1000)),
+        ('filter by homeworld, 100k rows', '{:.1f} ms'.format(filter_one * 1000)),
+        ('detail lookup', us(per_call(lambda: model.get(50000, links), number))),
+    ]
+
+
+@suite('encoding')
+def bench_encoding(number):
+    """Encoded size and encode/decode time of a 10k people list per format."""
+    from django.utils import timezone
+
+    from api.links import LinkBuilder
+    from api.negotiation import FORMATS
+
+    links = LinkBuilder('http://localhost:8000')
+    now = timezone.now()
+    data = [
+        {
+            'name': 'Person {}'.format(i),
+            'homeworld': links.planet(i % 60 + 1),
+            'height': 170,
+            'mass': 70,
+            'hair_color': 'brown',
+            'films': [links.film(f) for f in range(1, 4)],
+            'species': [links.species(1)],
+            'vehicles': [],
+            'starships': [],
+            'created': now.isoformat(),
+            'url': links.people(i),
+        }
+        for i in range(10000)
+    ]
+
+    results = []
+    for fmt in FORMATS:
+        content = fmt.dumps(data)
+        encode = min(timeit.repeat(lambda: fmt.dumps(data), number=1, repeat=3))
+        decode = min(timeit.repeat(lambda: fmt.loads(content), number=1, repeat=3))
+        results.append(('{} 10k people: size/encode/decode'.format(fmt.name),
+                        '{:.0f} kB / {:.1f} ms / {:.1f} ms'.format(
+                            len(content) / 1000, encode * 1000, decode * 1000)))
+    return results
+
+
+@suite('middleware')
+def bench_middleware(number):
+    """
+    Per-request cost of the full `MIDDLEWARE` stack vs the lean API handler,
+    on routes that answer without a query.
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import resolve
+
+    from swapi.handlers import LeanWSGIHandler
+
+    factory = RequestFactory()
+    full = WSGIHandler()
+    lean = LeanWSGIHandler()
+    number = max(number // 10, 1)
+
+    # Don't log a warning for each of the 400 responses
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    results = []
+    try:
+        for path in ('/people/?ids=invalid', '/training/json', '/training/arguments/7/'):
+            request = factory.get(path)
+            before = per_call(lambda: full.get_response(request), number)
+            after = per_call(lambda: lean.get_response(request), number)
+            results.append(('{} full/lean'.format(path), '{} / {} ({:.0f}% less)'.format(
+                us(before), us(after), (before - after) / before * 100)))
+    finally:
+        logger.setLevel(level)
+
+    full_resolve = per_call(lambda: resolve('/people/'), number)
+    lean_resolve = per_call(lambda: resolve('/people/', lean.urlconf), number)
+    results.append(('resolve /people/ full/API urlconf', '{} / {}'.format(
+        us(full_resolve), us(lean_resolve))))
+    return results
+
+
+STARTUP_SCRIPT = '''
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'swapi.settings')
+import django
+django.setup()
+setup = time.perf_counter()
+from swapi.warmup import warmup
+if sys.argv[1] == 'warm':
+    warmup()
+ready = time.perf_counter()
+from django.test import RequestFactory
+from swapi.handlers import LeanWSGIHandler
+handler = LeanWSGIHandler()
+request = RequestFactory().get('/training/json')
+before = time.perf_counter()
+handler.get_response(request)
+first = time.perf_counter()
+print(json.dumps([setup - start, ready - setup, first - before]))
+'''
+
+
+@suite('startup')
+def bench_startup(number):
+    """
+    Cold start of a fresh process, and the latency of its first request
+    with and without `swapi.warmup` (what each worker would pay without a
+    preloading server).
+    """
+    import json
+    import subprocess
+    import sys
+
+    from django.conf import settings
+
+    results = []
+    for mode in ('cold', 'warm'):
+        runs = [json.loads(subprocess.check_output(
+            [sys.executable, '-c', STARTUP_SCRIPT, mode], cwd=settings.BASE_DIR))
+            for _ in range(3)]
+        setup, warmup, first = (min(values) for values in zip(*runs))
+        results.append(('{}: django.setup() / warmup / 1st request'.format(mode),
+                        '{:.1f} ms / {:.1f} ms / {:.1f} ms'.format(
+                            setup * 1000, warmup * 1000, first * 1000)))
+    return results
@@ -0,0 +1,103 @@
+from django.db import connections, transaction
+
+from api.events import people_events
+from api.models import People
+from api.readmodel import RELATIONS, people_read_model
+from api.stats import group_rollup_amounts, update_rollups_in_bulk
+
+
+# Bulk change events list the affected ids up to this many, and `null`
+# (meaning "refetch") beyond that.
+MAX_EVENT_IDS = 1000
+
+# Fields whose values the rollups are made of
+ROLLUP_FIELDS = {'homeworld', 'homeworld_id', 'hair_color', 'height', 'mass'}
+
+
+def after_bulk_change(event_type, ids, count, deleted=False):
+    """
+    Single statement updates and deletes skip the model signals, so bring
+    the read model and the change stream up to date once committed. The
+    read model is patched row by row when the ids are known, and reloaded
+    in the background otherwise.
+    """
+    def publish():
+        if people_read_model.loaded:
+            if ids is None:
+                people_read_model.reload_in_background()
+            elif deleted:
+                for people_id in ids:
+                    people_read_model.remove(people_id)
+            else:
+                for people in People.objects.filter(id__in=ids):
+                    people_read_model.upsert(people)
+        people_events.publish(event_type, {'ids': ids, 'count': count})
+    transaction.on_commit(publish)
+
+
+def affected_ids(queryset):
+    ids = list(queryset.values_list('id', flat=True)[:MAX_EVENT_IDS + 1])
+    return ids if len(ids) <= MAX_EVENT_IDS else None
+
+
+def updated_groups(groups, values):
+    """
+    `group_rollup_amounts()` of the same people once `values` (plain values,
+    not expressions) are set on them.
+    """
+    new_groups = {}
+    for (homeworld_id, hair_color), amounts in groups.items():
+        if 'homeworld' in values:
+            homeworld_id = values['homeworld'].pk
+        homeworld_id = values.get('homeworld_id', homeworld_id)
+        hair_color = values.get('hair_color', hair_color)
+        amounts = dict(amounts)
+        for field in ('height', 'mass'):
+            if field in values:
+                value = values[field]
+                amounts[field + '_sum'] = 0 if value is None else int(value) * amounts['count']
+                amounts[field + '_count'] = 0 if value is None else amounts['count']
+        group = new_groups.setdefault((homeworld_id, hair_color), dict.fromkeys(amounts, 0))
+        for field, amount in amounts.items():
+            group[field] += amount
+    return new_groups
+
+
+def bulk_update_people(queryset, **values):
+    """`UPDATE` every person in `queryset` with one statement."""
+    with transaction.atomic():
+        ids = affected_ids(queryset)
+        people = People.objects.filter(id__in=queryset.order_by().values('id'))
+        groups = group_rollup_amounts(people) if ROLLUP_FIELDS & set(values) else None
+        updated = people.update(**values)
+        if groups is not None:
+            update_rollups_in_bulk(groups, updated_groups(groups, values))
+        after_bulk_change('people.bulk_updated', ids, updated)
+    return updated
+
+
+def bulk_delete_people(queryset):
+    """
+    `DELETE` every person in `queryset` with one statement per table (their
+    link tables, then `People`) instead of loading and deleting each row.
+    """
+    connection = connections[queryset.db]
+    with transaction.atomic(using=queryset.db):
+        ids = affected_ids(queryset)
+        subquery = queryset.order_by().values('id')
+        groups = group_rollup_amounts(People.objects.filter(id__in=subquery))
+        # Plain SQL: `QuerySet.delete()` would load every row to send signals
+        sql, params = subquery.query.sql_with_params()
+        tables = [(getattr(People, relation).through._meta.db_table,
+                   getattr(People, relation).field.m2m_column_name())
+                  for relation in RELATIONS]
+        tables.append((People._meta.db_table, People._meta.pk.column))
+        with connection.cursor() as cursor:
+            for table, column in tables:
+                cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                    connection.ops.quote_name(table), connection.ops.quote_name(column), sql),
+                    params)
+            deleted = cursor.rowcount
+        update_rollups_in_bulk(groups, {})
+        after_bulk_change('people.bulk_deleted', ids, deleted, deleted=True)
+    return deleted
@@ -0,0 +1,181 @@
+"""
+Per-route request deadlines.
+
+Each route in `DEADLINES` gets `(default, maximum)` seconds to respond.
+Clients can ask for another timeout with an `X-Request-Timeout` header,
+clamped between `DEADLINE_MIN` and the maximum. When a proxy sets
+`X-Request-Start` (e.g. nginx `t=${msec}`), the time spent queued counts too.
+
+The deadline is enforced on the SQLite connection with a progress handler,
+which interrupts the running query once it has passed: the request then
+gets a `504`. A request whose deadline expired before the view started is
+shed with a `503` without doing any work. Streaming responses (e.g. the
+change stream) are long-lived by design, they are only bounded until the
+view returns them.
+"""
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+
+
+TIMEOUT_HEADER = 'HTTP_X_REQUEST_TIMEOUT'
+START_HEADER = 'HTTP_X_REQUEST_START'
+PROGRESS_STEPS = 1000  # SQLite VM instructions between deadline checks
+
+
+class DeadlineMetrics:
+    """How often each route's deadlines fire, per process."""
+
+    OUTCOMES = ('requests', 'shed', 'timed_out')
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, route, outcome):
+        with self._lock:
+            self._counts[route, outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = sorted({route for route, _ in self._counts})
+            return {
+                route: {outcome: self._counts[route, outcome] for outcome in self.OUTCOMES}
+                for route in routes
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+metrics = DeadlineMetrics()
+
+
+def parse_request_start(value):
+    """Seconds since the epoch from `t=<seconds, ms or us>`, or `None`."""
+    try:
+        start = float(value[2:] if value.startswith('t=') else value)
+    except ValueError:
+        return None
+    if not math.isfinite(start):
+        return None
+    if start > 1e14:
+        return start / 1e6
+    if start > 1e11:
+        return start / 1e3
+    return start
+
+
+def get_timeout(request, default, maximum):
+    try:
+        timeout = float(request.META[TIMEOUT_HEADER])
+    except (KeyError, ValueError):
+        return default
+    if not math.isfinite(timeout):
+        return default  # `nan` would get past the clamp and never expire
+    return min(max(timeout, getattr(settings, 'DEADLINE_MIN', 0.05)), maximum)
+
+
+def get_expiry(request, timeout):
+    """`time.monotonic()` value at which the request's deadline expires."""
+    now = time.monotonic()
+    start = parse_request_start(request.META.get(START_HEADER, ''))
+    if start is not None:
+        # Never more than the timeout ago, in case of clock skew
+        now -= min(max(time.time() - start, 0), timeout)
+    return now + timeout
+
+
+def expired(expires_at):
+    return time.monotonic() >= expires_at
+
+
+_local = threading.local()
+
+
+def install_progress_handler(raw, expires_at):
+    if expires_at is None:
+        raw.set_progress_handler(None, PROGRESS_STEPS)
+    else:
+        raw.set_progress_handler(partial(expired, expires_at), PROGRESS_STEPS)
+
+
+@receiver(connection_created)
+def enforce_on_connect(sender, connection, **kwargs):
+    # A connection opened while a deadline is in force, in this thread
+    stack = getattr(_local, 'stack', None)
+    if stack and connection.vendor == 'sqlite' and connection.alias == DEFAULT_DB_ALIAS:
+        install_progress_handler(connection.connection, stack[-1])
+
+
+@contextmanager
+def enforce(expires_at):
+    """
+    Interrupt SQLite queries on the default connection once `expires_at`
+    has passed. Nested deadlines (e.g. `/batch/` sub-requests) can only
+    shorten the current one. The connection isn't opened for this, views
+    served without a query stay without one.
+    """
+    stack = _local.__dict__.setdefault('stack', [])
+    if stack:
+        expires_at = min(expires_at, stack[-1])
+    stack.append(expires_at)
+    if connection.vendor == 'sqlite' and connection.connection is not None:
+        install_progress_handler(connection.connection, expires_at)
+    try:
+        yield
+    finally:
+        stack.pop()
+        if connection.vendor == 'sqlite' and connection.connection is not None:
+            install_progress_handler(connection.connection, stack[-1] if stack else None)
+
+
+def deadline(route=None):
+    """
+    Decorator applying the `DEADLINES[route]` deadline to a view. Without
+    `route`, the view's `resource` URL argument names it. Routes missing
+    from `DEADLINES` have no deadline.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            name = route or kwargs.get('resource')
+            limits = getattr(settings, 'DEADLINES', {}).get(name)
+            if limits is None:
+                return view(request, *args, **kwargs)
+
+            timeout = get_timeout(request, *limits)
+            expires_at = get_expiry(request, timeout)
+            metrics.incr(name, 'requests')
+            if expired(expires_at):
+                metrics.incr(name, 'shed')
+                return JsonResponse({
+                    'msg': 'Request deadline expired before it could be served',
+                    'success': False
+                }, status=503)
+
+            try:
+                with enforce(expires_at):
+                    response = view(request, *args, **kwargs)
+            except OperationalError:
+                if not expired(expires_at):
+                    raise
+                metrics.incr(name, 'timed_out')
+                return JsonResponse({
+                    'msg': 'Request deadline of {:g}s exceeded'.format(timeout),
+                    'success': False
+                }, status=504)
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,141 @@
+import json
+import queue
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+class Event:
+    """
+    A single change notification, already rendered to the Server-Sent Events
+    wire format so that every subscriber shares the same encoded bytes.
+    """
+
+    __slots__ = ('id', 'type', 'data', 'payload')
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+        self.payload = format_sse(json.dumps(data), event=type, id=id)
+
+
+class Subscriber:
+    """
+    One connected client. Events are buffered in a bounded queue; when the
+    queue is full the hub evicts the subscriber instead of blocking writers.
+    """
+
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.evicted = False
+
+
+class EventHub:
+    """
+    In-process fan-out of change events to any number of subscribers.
+
+    The hub keeps a bounded history of recent events so that reconnecting
+    clients can resume from their `Last-Event-ID` without missing changes.
+    """
+
+    def __init__(self, queue_size=100, history_size=1000):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._last_id = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop it so it can't hold up everyone else.
+                # The client can reconnect and resume from the history.
+                self.unsubscribe(subscriber)
+                subscriber.evicted = True
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a new subscriber and return it along with the events it
+        missed since `last_event_id`. If the history no longer reaches back
+        that far, the backlog is `None` and the client must refetch.
+        """
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            backlog = []
+            if last_event_id is not None and last_event_id != self._last_id:
+                oldest = self._history[0].id if self._history else self._last_id + 1
+                if last_event_id > self._last_id or last_event_id + 1 < oldest:
+                    # Unknown id (e.g. the process restarted) or too old.
+                    backlog = None
+                else:
+                    backlog = [e for e in self._history if e.id > last_event_id]
+            self._subscribers.add(subscriber)
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+
+def format_sse(data, event=None, id=None):
+    lines = []
+    if id is not None:
+        lines.append('id: {}'.format(id))
+    if event is not None:
+        lines.append('event: {}'.format(event))
+    for line in data.splitlines() or ['']:
+        lines.append('data: {}'.format(line))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def event_stream(hub, last_event_id, heartbeat):
+    """
+    Generator producing the body of a `text/event-stream` response. It sends
+    the resume backlog first, then live events, with a comment line every
+    `heartbeat` seconds to keep proxies from closing an idle connection.
+
+    The subscription only starts once the body is iterated, so a response
+    that is discarded without being sent never leaks a subscriber.
+    """
+    subscriber, backlog = hub.subscribe(last_event_id)
+    try:
+        yield 'retry: {}\n\n'.format(int(heartbeat * 1000)).encode('utf-8')
+        if backlog is None:
+            yield format_sse(json.dumps({'msg': 'History lost, refetch state'}), event='reset')
+        else:
+            for event in backlog:
+                yield event.payload
+
+        while True:
+            if subscriber.evicted and subscriber.queue.empty():
+                yield format_sse(json.dumps({'msg': 'Subscriber too slow'}), event='evicted')
+                return
+            try:
+                event = subscriber.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield b': keep-alive\n\n'
+                continue
+            yield event.payload
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+people_events = EventHub(
+    queue_size=getattr(settings, 'PEOPLE_EVENTS_QUEUE_SIZE', 100),
+    history_size=getattr(settings, 'PEOPLE_EVENTS_HISTORY_SIZE', 1000),
+)
@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from api.negotiation import FORMATS_BY_TYPE
+from api.ratelimit import get_client_id
+
+
+class StoredResponse:
+
+    __slots__ = ('status', 'content', 'headers')
+
+    def __init__(self, response):
+        self.status = response.status_code
+        self.content = response.content
+        self.headers = list(response.items())  # `Content-Type`, `Location`, `Vary`...
+
+    def to_response(self, fmt=None):
+        """
+        The stored response, re-encoded in `fmt` if it was negotiated and the
+        retry accepts another format than the original request.
+        """
+        content = self.content
+        headers = dict(self.headers)
+        stored_fmt = FORMATS_BY_TYPE.get(headers.get('Content-Type'))
+        if fmt is not None and stored_fmt is not None and fmt is not stored_fmt:
+            content = fmt.dumps(stored_fmt.loads(content)) if content else content
+            headers['Content-Type'] = fmt.media_type
+        response = HttpResponse(content, status=self.status)
+        for header, value in headers.items():
+            response[header] = value
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class Entry:
+
+    __slots__ = ('fingerprint', 'expires', 'response', 'done')
+
+    def __init__(self, fingerprint, expires):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.response = None
+        self.done = threading.Event()
+
+
+class IdempotencyStore:
+    """
+    Responses of requests sent with an `Idempotency-Key`, kept for `ttl`
+    seconds. A key that is still being processed is marked in-flight, so a
+    concurrent duplicate waits for the first request instead of re-running it.
+    """
+
+    def __init__(self, ttl=86400, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Entries are kept in insertion order, so expired ones are at the front.
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now and (
+                    len(self._entries) <= self.max_entries or not entry.done.is_set()):
+                break  # never drop an in-flight entry before it expires
+            del self._entries[key]
+
+    def begin(self, key, fingerprint):
+        """
+        Claim `key`. Returns `(entry, True)` if the caller must process the
+        request, or `(entry, False)` if another request owns it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = Entry(fingerprint, now + self.ttl)
+            self._entries[key] = entry
+            return entry, True
+
+    def finish(self, key, entry, response):
+        entry.response = StoredResponse(response)
+        entry.done.set()
+
+    def abort(self, key, entry):
+        """Release `key` without storing anything, so it can be retried."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+store = IdempotencyStore(
+    ttl=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400),
+    max_entries=getattr(settings, 'IDEMPOTENCY_MAX_KEYS', 10000),
+)
+
+
+def get_client_scope(request):
+    """
+    Who sent the request: the logged in user, or else the client address, so
+    that clients choosing the same key don't get each other's responses.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return 'user:{}'.format(user.pk)
+    return 'client:{}'.format(get_client_id(request))
+
+
+def idempotent(view):
+    """
+    View decorator honouring the `Idempotency-Key` header on POST requests.
+
+    The first response for a key is stored and replayed for any retry with
+    the same key and payload, without running the view again. Server errors
+    and 429s are not stored, so the client can retry them.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'msg': 'Idempotency-Key is too long', 'success': False}, status=400)
+
+        scoped_key = '{} {} {}'.format(get_client_scope(request), request.path, key)
+        fingerprint = hashlib.sha256(request.body).digest()
+        wait_timeout = getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 5)
+        while True:
+            entry, owner = store.begin(scoped_key, fingerprint)
+            if owner:
+                break
+            if entry.fingerprint != fingerprint:
+                return JsonResponse({
+                    'msg': 'Idempotency-Key was used with a different payload',
+                    'success': False
+                }, status=422)
+            if not entry.done.wait(wait_timeout):
+                return JsonResponse({
+                    'msg': 'A request with this Idempotency-Key is in progress',
+                    'success': False
+                }, status=409)
+            if entry.response is not None:
+                return entry.response.to_response(getattr(request, 'response_format', None))
+            # The first request was aborted: try to claim the key again.
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            store.abort(scoped_key, entry)
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            store.abort(scoped_key, entry)
+        else:
+            store.finish(scoped_key, entry, response)
+        return response
+    return wrapper
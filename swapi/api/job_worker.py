@@ -0,0 +1,14 @@
+"""
+Entry points of the `run_jobs` worker processes. They are spawned without
+Django set up, so this module must not import models at import time.
+"""
+import django
+
+
+def setup():
+    django.setup()
+
+
+def run(job_id):
+    from api.jobs import run_job
+    run_job(job_id)
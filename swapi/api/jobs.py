@@ -0,0 +1,331 @@
+"""
+Background jobs, for operations too long to run inside a request.
+
+Jobs are rows of the `Job` table, so no broker is needed: views enqueue them
+and `manage.py run_jobs` claims them and runs up to `JOBS_CONCURRENCY` at a
+time in a local process pool. A job that raises is retried after
+`JOBS_RETRY_DELAY` seconds, doubled on every attempt, until it has been
+tried `max_attempts` times. Cancelling a running job is cooperative: the job
+function calls `context.check_cancelled()` between units of work.
+
+Run a single `run_jobs` per database; on start it requeues the jobs left
+running by a previous one. It also deletes the result files of jobs
+finished more than `JOBS_RESULT_TTL` seconds ago.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from api import job_worker
+from api.links import get_link_builder
+from api.models import Job, People
+from api.serializers import people_links, serialize_people_as_json
+from api.stats import rebuild_rollups
+from api.validation import Field, compile_schema
+
+logger = logging.getLogger(__name__)
+
+
+class Cancelled(Exception):
+    """Raised by `JobContext.check_cancelled()` once cancellation is asked."""
+
+
+class QueueFull(Exception):
+    """Raised by `enqueue()` when `JOBS_MAX_PENDING` jobs of a kind are waiting."""
+
+
+class JobType:
+
+    def __init__(self, name, func, schema, staff_only=False):
+        self.name = name
+        self.func = func
+        self.validate = compile_schema(schema)
+        self.staff_only = staff_only
+
+
+JOBS = OrderedDict()
+
+
+def job(name, schema=None, staff_only=False):
+    """
+    Register the decorated `func(context, **params)` as job `name`, which
+    only staff users can enqueue with `staff_only`.
+    """
+    def decorator(func):
+        JOBS[name] = JobType(name, func, schema or {}, staff_only)
+        return func
+    return decorator
+
+
+class JobContext:
+
+    def __init__(self, job):
+        self.job = job
+        self.result_file = ''
+        self._checked_at = time.monotonic()
+
+    def check_cancelled(self, every=1.0):
+        """Raise `Cancelled` if asked to, reading the database at most `every` seconds."""
+        now = time.monotonic()
+        if now - self._checked_at < every:
+            return
+        self._checked_at = now
+        if Job.objects.filter(id=self.job.id, cancel_requested=True).exists():
+            raise Cancelled()
+
+    def result_path(self, extension):
+        directory = getattr(settings, 'JOBS_RESULT_DIR', os.path.join(settings.BASE_DIR, 'job_results'))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, 'job-{}{}'.format(self.job.id, extension))
+
+
+# Job types
+
+@job('export_people', schema={
+    'homeworld': Field(int, null=True),
+    'hair_color': Field(str, null=True, choices=[value for value, _ in People.HAIR_COLOR_CHOICES]),
+})
+def export_people(context, homeworld=None, hair_color=None, chunk_size=1000):
+    """Every person as a JSON list, in the format of `/people/`."""
+    queryset = People.objects.order_by('id')
+    if homeworld is not None:
+        queryset = queryset.filter(homeworld_id=homeworld)
+    if hair_color is not None:
+        queryset = queryset.filter(hair_color=hair_color)
+
+    links = get_link_builder()
+    path = context.result_path('.json')
+    count = 0
+    last_id = 0
+    with open(path + '.tmp', 'w') as f:
+        f.write('[')
+        while True:
+            # Keyset pagination, so the links of a chunk are one id range
+            chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if chunk:
+                related = people_links(people_id__gt=last_id, people_id__lte=chunk[-1].id)
+            for people in chunk:
+                f.write(',' if count else '')
+                json.dump(serialize_people_as_json(people, links, related), f)
+                count += 1
+            if len(chunk) < chunk_size:
+                break
+            last_id = chunk[-1].id
+            context.check_cancelled()
+        f.write(']')
+    os.replace(path + '.tmp', path)
+    context.result_file = path
+    return {'count': count}
+
+
+@job('rebuild_stats')
+def rebuild_stats(context):
+    """Recompute the `People` statistics rollups."""
+    return {'rollups': rebuild_rollups()}
+
+
+@job('reindex', staff_only=True)
+def reindex(context):
+    """
+    Rebuild the SQLite indexes and refresh the planner statistics. Holds the
+    database write lock throughout, hence staff only.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('REINDEX')
+        cursor.execute('ANALYZE')
+    return {}
+
+
+JOB_SCHEMA = {
+    'kind': Field(str, choices=list(JOBS)),
+    'params': Field(dict, null=True, required=False),
+}
+
+validate_job_request = compile_schema(JOB_SCHEMA)
+
+
+def validate_job(payload):
+    """
+    Check a `{"kind": ..., "params": {...}}` payload against the job types.
+    Returns `(kind, params)` and a dict of errors.
+    """
+    cleaned, errors = validate_job_request(payload)
+    if errors:
+        return None, errors
+    params, errors = JOBS[cleaned['kind']].validate(cleaned.get('params') or {}, partial=True)
+    if errors:
+        return None, {'params': errors}
+    return (cleaned['kind'], params), {}
+
+
+# Queue
+
+def enqueue(kind, params=None):
+    max_pending = getattr(settings, 'JOBS_MAX_PENDING', 10)
+    if max_pending is not None and Job.objects.filter(
+            kind=kind, status=Job.PENDING).count() >= max_pending:
+        raise QueueFull('Too many pending {} jobs (max {})'.format(kind, max_pending))
+    return Job.objects.create(
+        kind=kind, params=json.dumps(params or {}),
+        max_attempts=getattr(settings, 'JOBS_MAX_ATTEMPTS', 3))
+
+
+def cancel(job_id):
+    """
+    Cancel a pending job right away, or ask a running one to stop. Returns
+    whether the job was found unfinished.
+    """
+    now = timezone.now()
+    if Job.objects.filter(id=job_id, status=Job.PENDING).update(
+            status=Job.CANCELLED, cancel_requested=True, finished=now):
+        return True
+    return bool(Job.objects.filter(id=job_id, status=Job.RUNNING).update(cancel_requested=True))
+
+
+def claim(limit):
+    """
+    Mark up to `limit` jobs that are due as running and return their ids.
+    Each claim is a conditional update, so a job is never claimed twice.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by(
+        'run_after', 'id').values_list('id', flat=True)[:limit]
+    return [
+        job_id for job_id in due
+        if Job.objects.filter(id=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING, started=now, attempts=F('attempts') + 1)
+    ]
+
+
+def finish(job_id, status, **fields):
+    Job.objects.filter(id=job_id).update(status=status, finished=timezone.now(), **fields)
+
+
+def fail_attempt(job_id, error):
+    """Retry the job later, unless this was its last attempt."""
+    job = Job.objects.get(id=job_id)
+    if job.cancel_requested:
+        finish(job_id, Job.CANCELLED, error=error)
+    elif job.attempts < job.max_attempts:
+        delay = getattr(settings, 'JOBS_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+        Job.objects.filter(id=job_id).update(
+            status=Job.PENDING, error=error, run_after=timezone.now() + timedelta(seconds=delay))
+    else:
+        finish(job_id, Job.FAILED, error=error)
+
+
+def purge_results(ttl):
+    """
+    Delete the result files of the jobs finished more than `ttl` seconds
+    ago. Returns how many were deleted.
+    """
+    expired = Job.objects.filter(
+        finished__lt=timezone.now() - timedelta(seconds=ttl)).exclude(result_file='')
+    count = 0
+    for job_id, path in expired.values_list('id', 'result_file'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        Job.objects.filter(id=job_id).update(result_file='')
+        count += 1
+    return count
+
+
+def run_job(job_id):
+    """Run a claimed job to completion, recording the outcome."""
+    job = Job.objects.get(id=job_id)
+    context = JobContext(job)
+    try:
+        result = JOBS[job.kind].func(context, **json.loads(job.params))
+    except Cancelled:
+        finish(job_id, Job.CANCELLED)
+    except Exception as e:
+        logger.exception('Job %s failed', job)
+        fail_attempt(job_id, '{}: {}'.format(type(e).__name__, e))
+    else:
+        finish(job_id, Job.SUCCEEDED, result=json.dumps(result), result_file=context.result_file)
+
+
+class Runner:
+    """
+    Claims due jobs and runs them in a pool of `concurrency` processes,
+    polling the table every `poll_interval` seconds. Expired result files
+    are purged every `purge_interval` seconds.
+    """
+
+    purge_interval = 60
+
+    def __init__(self, concurrency, poll_interval, executor_factory=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.executor_factory = executor_factory or self.process_pool
+        self._purged_at = None
+
+    def process_pool(self):
+        # Spawned rather than forked, so workers don't inherit our connection
+        return ProcessPoolExecutor(
+            self.concurrency, mp_context=multiprocessing.get_context('spawn'),
+            initializer=job_worker.setup)
+
+    def purge(self):
+        ttl = getattr(settings, 'JOBS_RESULT_TTL', 24 * 60 * 60)
+        now = time.monotonic()
+        if ttl is None:
+            return
+        if self._purged_at is not None and now - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = now
+        count = purge_results(ttl)
+        if count:
+            logger.info('Deleted %d expired job results', count)
+
+    def requeue_running(self):
+        return Job.objects.filter(status=Job.RUNNING).update(status=Job.PENDING)
+
+    def run(self, once=False):
+        """
+        Run jobs forever, or with `once` until none is due or running.
+        """
+        self.requeue_running()
+        while True:
+            try:
+                with self.executor_factory() as executor:
+                    return self._run(executor, once)
+            except BrokenProcessPool:
+                logger.error('A job worker died, restarting the pool')
+
+    def _run(self, executor, once):
+        running = {}
+        try:
+            while True:
+                self.purge()
+                for job_id in claim(self.concurrency - len(running)):
+                    running[executor.submit(job_worker.run, job_id)] = job_id
+                if once and not running:
+                    return
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        running[future] = job_id
+                        raise
+                    except Exception as e:
+                        fail_attempt(job_id, '{}: {}'.format(type(e).__name__, e))
+        except BrokenProcessPool:
+            for job_id in running.values():
+                fail_attempt(job_id, 'Worker process died')
+            raise
@@ -0,0 +1,59 @@
+from django.conf import settings
+
+
+class LinkBuilder:
+    """
+    Builds absolute resource URLs from prefixes computed once per base URL,
+    so that serializing a row only costs a string concatenation per link.
+    """
+
+    def __init__(self, base_url):
+        base_url = base_url.rstrip('/')
+        self.base_url = base_url
+        self.people_prefix = base_url + '/people/'
+        self.planet_prefix = base_url + '/planets/'
+        self.film_prefix = base_url + '/films/'
+        self.species_prefix = base_url + '/species/'
+        self.vehicle_prefix = base_url + '/vehicles/'
+        self.starship_prefix = base_url + '/starships/'
+        self.job_prefix = base_url + '/jobs/'
+
+    def people(self, people_id):
+        return self.people_prefix + str(people_id) + '/'
+
+    def planet(self, planet_id):
+        return self.planet_prefix + str(planet_id) + '/'
+
+    def film(self, film_id):
+        return self.film_prefix + str(film_id) + '/'
+
+    def species(self, species_id):
+        return self.species_prefix + str(species_id) + '/'
+
+    def vehicle(self, vehicle_id):
+        return self.vehicle_prefix + str(vehicle_id) + '/'
+
+    def starship(self, starship_id):
+        return self.starship_prefix + str(starship_id) + '/'
+
+    def job(self, job_id):
+        return self.job_prefix + str(job_id) + '/'
+
+
+_builders = {}
+
+
+def get_link_builder(request=None):
+    """
+    Return the `LinkBuilder` for `settings.SWAPI_BASE_URL`, or for the host
+    the request was sent to when that setting is `None`.
+    """
+    base_url = getattr(settings, 'SWAPI_BASE_URL', None)
+    if base_url is None:
+        base_url = request.build_absolute_uri('/') if request is not None else 'http://localhost:8000'
+    builder = _builders.get(base_url)
+    if builder is None:
+        if len(_builders) > 100:  # untrusted Host headers can't grow this forever
+            _builders.clear()
+        builder = _builders[base_url] = LinkBuilder(base_url)
+    return builder
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Run micro benchmarks. Available suites: {}'.format(', '.join(SUITES))
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help='Suites to run (default: all)')
+        parser.add_argument('--number', type=int, default=10000,
+                            help='Iterations per measurement')
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = [name for name in names if name not in SUITES]
+        if unknown:
+            raise CommandError('Unknown suite(s): {}'.format(', '.join(unknown)))
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, value in SUITES[name](options['number']):
+                self.stdout.write('  {:<45} {}'.format(label, value))
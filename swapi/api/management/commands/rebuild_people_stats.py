@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the People statistics rollups from scratch.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS('Rebuilt {} rollup rows.'.format(rows)))
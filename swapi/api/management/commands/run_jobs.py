@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import Runner
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the Job table in a local process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=getattr(settings, 'JOBS_CONCURRENCY', 2),
+                            help='Jobs run at the same time')
+        parser.add_argument('--poll-interval', type=float,
+                            default=getattr(settings, 'JOBS_POLL_INTERVAL', 1),
+                            help='Seconds between checks for new jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due or running')
+
+    def handle(self, *args, **options):
+        runner = Runner(options['concurrency'], options['poll_interval'])
+        self.stdout.write('Running jobs, {} at a time.'.format(options['concurrency']))
+        try:
+            runner.run(once=options['once'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,73 @@
+# Generated by Django 2.1.1 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Film',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('episode_id', models.IntegerField(blank=True, null=True)),
+                ('director', models.CharField(blank=True, max_length=255)),
+                ('release_date', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Species',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('classification', models.CharField(blank=True, max_length=255)),
+                ('language', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'verbose_name_plural': 'species',
+            },
+        ),
+        migrations.CreateModel(
+            name='Starship',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('model', models.CharField(blank=True, max_length=255)),
+                ('starship_class', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Vehicle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('model', models.CharField(blank=True, max_length=255)),
+                ('vehicle_class', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='people',
+            name='films',
+            field=models.ManyToManyField(blank=True, related_name='characters', to='api.Film'),
+        ),
+        migrations.AddField(
+            model_name='people',
+            name='species',
+            field=models.ManyToManyField(blank=True, related_name='people', to='api.Species'),
+        ),
+        migrations.AddField(
+            model_name='people',
+            name='starships',
+            field=models.ManyToManyField(blank=True, related_name='pilots', to='api.Starship'),
+        ),
+        migrations.AddField(
+            model_name='people',
+            name='vehicles',
+            field=models.ManyToManyField(blank=True, related_name='pilots', to='api.Vehicle'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.1.1 on 2026-10-19 04:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+FIELDS = ('count', 'height_sum', 'height_count', 'mass_sum', 'mass_count')
+
+
+def populate_rollups(apps, schema_editor):
+    People = apps.get_model('api', 'People')
+    PeopleRollup = apps.get_model('api', 'PeopleRollup')
+    groups = People.objects.values('homeworld_id', 'hair_color').annotate(
+        count=Count('id'), height_sum=Sum('height'), height_count=Count('height'),
+        mass_sum=Sum('mass'), mass_count=Count('mass')).order_by()
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for group in groups:
+        keys = (('all', ''), ('homeworld', str(group['homeworld_id'])),
+                ('hair_color', group['hair_color'] or ''))
+        for key in keys:
+            for field in FIELDS:
+                totals[key][field] += group[field] or 0
+    PeopleRollup.objects.bulk_create([
+        PeopleRollup(dimension=dimension, value=value, **fields)
+        for (dimension, value), fields in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_relations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeopleRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('value', models.CharField(blank=True, max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('height_sum', models.BigIntegerField(default=0)),
+                ('height_count', models.IntegerField(default=0)),
+                ('mass_sum', models.BigIntegerField(default=0)),
+                ('mass_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('dimension', 'value')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
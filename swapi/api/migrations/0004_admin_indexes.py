@@ -0,0 +1,28 @@
+# Generated by Django 2.1.1 on 2026-10-19 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_people_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='people',
+            name='hair_color',
+            field=models.CharField(blank=True, choices=[('blond', 'Blond'), ('black', 'Black'), ('brown', 'Brown'), ('red', 'Red')], db_index=True, max_length=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='people',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='planet',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
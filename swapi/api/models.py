@@ -1,8 +1,9 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Planet(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     population = models.IntegerField(null=True, blank=True)
     diameter = models.IntegerField(null=True, blank=True)
 
@@ -10,6 +11,46 @@ class Planet(models.Model):
         return self.name
 
 
+class Film(models.Model):
+    title = models.CharField(max_length=255)
+    episode_id = models.IntegerField(null=True, blank=True)
+    director = models.CharField(max_length=255, blank=True)
+    release_date = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return self.title
+
+
+class Species(models.Model):
+    name = models.CharField(max_length=255)
+    classification = models.CharField(max_length=255, blank=True)
+    language = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'species'
+
+    def __str__(self):
+        return self.name
+
+
+class Vehicle(models.Model):
+    name = models.CharField(max_length=255)
+    model = models.CharField(max_length=255, blank=True)
+    vehicle_class = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Starship(models.Model):
+    name = models.CharField(max_length=255)
+    model = models.CharField(max_length=255, blank=True)
+    starship_class = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
 class People(models.Model):
     HAIR_COLOR_CHOICES = (
         ('blond', 'Blond'),
@@ -17,13 +58,79 @@ class People(models.Model):
         ('brown', 'Brown'),
         ('red', 'Red'),
     )
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     homeworld = models.ForeignKey(Planet, on_delete=models.CASCADE)
     height = models.IntegerField(null=True, blank=True)
     mass = models.IntegerField(null=True, blank=True)
     hair_color = models.CharField(
-        max_length=10, choices=HAIR_COLOR_CHOICES, null=True, blank=True)
+        max_length=10, choices=HAIR_COLOR_CHOICES, null=True, blank=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True)
+    films = models.ManyToManyField(Film, related_name='characters', blank=True)
+    species = models.ManyToManyField(Species, related_name='people', blank=True)
+    vehicles = models.ManyToManyField(Vehicle, related_name='pilots', blank=True)
+    starships = models.ManyToManyField(Starship, related_name='pilots', blank=True)
 
     def __str__(self):
         return self.name
+
+
+class PeopleRollup(models.Model):
+    """
+    Pre-aggregated `People` statistics, kept up to date on every write so
+    that reading them doesn't depend on the number of people.
+
+    There is one row per (`dimension`, `value`): `('all', '')` for the
+    totals, `('homeworld', <planet id>)` and `('hair_color', <color>)`, with
+    `''` standing for people without hair color.
+    """
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=20, blank=True)
+    count = models.IntegerField(default=0)
+    height_sum = models.BigIntegerField(default=0)
+    height_count = models.IntegerField(default=0)
+    mass_sum = models.BigIntegerField(default=0)
+    mass_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('dimension', 'value')
+
+    def __str__(self):
+        return '{}={}'.format(self.dimension, self.value)
+
+
+class Job(models.Model):
+    """
+    A background job, run by `manage.py run_jobs` (see `api.jobs`). `params`
+    and `result` hold JSON; big results are written to `result_file`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    kind = models.CharField(max_length=50)
+    params = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    cancel_requested = models.BooleanField(default=False)
+    result = models.TextField(null=True, blank=True)
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = ('status', 'run_after')
+
+    def __str__(self):
+        return '{} #{}'.format(self.kind, self.id)
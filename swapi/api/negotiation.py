@@ -0,0 +1,146 @@
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+
+class ParseError(Exception):
+    """Raised when a request body can't be decoded."""
+
+
+class NotAcceptable(Exception):
+    """Raised when no supported media type matches the `Accept` header."""
+
+
+class Format:
+
+    def __init__(self, name, media_type, dumps, loads, aliases=()):
+        self.name = name
+        self.media_type = media_type
+        self.dumps = dumps
+        self.loads = loads
+        self.aliases = aliases
+
+
+def json_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def json_loads(content):
+    return json.loads(content)
+
+
+JSON = Format('JSON', 'application/json', json_dumps, json_loads)
+
+# Supported formats, in order of preference when the client accepts several
+FORMATS = [JSON]
+if msgpack is not None:
+    FORMATS.append(Format(
+        'MessagePack', 'application/msgpack',
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda content: msgpack.unpackb(content, raw=False),
+        aliases=('application/x-msgpack', 'application/vnd.msgpack')))
+if cbor2 is not None:
+    FORMATS.append(Format('CBOR', 'application/cbor', cbor2.dumps, cbor2.loads))
+
+FORMATS_BY_TYPE = {
+    media_type: fmt for fmt in FORMATS for media_type in (fmt.media_type,) + fmt.aliases
+}
+
+
+def parse_accept(header):
+    """`(media_type, q)` pairs of an `Accept` header, best first."""
+    accepted = []
+    for position, item in enumerate(header.split(',')):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type and q > 0:
+            accepted.append((-q, position, media_type.lower()))
+    return [(media_type, -q) for q, _, media_type in sorted(accepted)]
+
+
+def select_format(request):
+    header = request.META.get('HTTP_ACCEPT', '').strip()
+    if not header:
+        return JSON
+    for media_type, _ in parse_accept(header):
+        if media_type in FORMATS_BY_TYPE:
+            return FORMATS_BY_TYPE[media_type]
+        if media_type in ('*/*', 'application/*'):
+            return JSON
+    raise NotAcceptable()
+
+
+def parse_body(request):
+    """
+    Decode the request body according to its `Content-Type`. Anything that
+    isn't a known binary format is read as JSON.
+    """
+    media_type = request.META.get('CONTENT_TYPE', '').split(';')[0].strip().lower()
+    fmt = FORMATS_BY_TYPE.get(media_type, JSON)
+    try:
+        return fmt.loads(request.body)
+    except Exception:
+        raise ParseError('Provide a valid {} payload'.format(fmt.name))
+
+
+def not_acceptable():
+    response = HttpResponse(json_dumps({
+        'msg': 'Not acceptable, supported types: {}'.format(
+            ', '.join(f.media_type for f in FORMATS)),
+        'success': False,
+    }), status=406, content_type=JSON.media_type)
+    response['Vary'] = 'Accept'
+    return response
+
+
+def negotiated(view):
+    """
+    View decorator selecting the response format before the view runs, so
+    a request accepting none of `FORMATS` gets a `406` before any write is
+    made. The format is kept as `request.response_format` for `render()`.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            request.response_format = select_format(request)
+        except NotAcceptable:
+            return not_acceptable()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def render(request, data, status=200, fmt=None):
+    """
+    Like `JsonResponse`, but encoded in `fmt`, by default the format chosen
+    by `negotiated` or else the one the client asked for in its `Accept`
+    header: JSON by default, MessagePack or CBOR when installed. Responds
+    `406` if none of the accepted types is supported.
+    """
+    if fmt is None:
+        fmt = getattr(request, 'response_format', None)
+    if fmt is None:
+        try:
+            fmt = select_format(request)
+        except NotAcceptable:
+            return not_acceptable()
+    response = HttpResponse(fmt.dumps(data), status=status, content_type=fmt.media_type)
+    response['Vary'] = 'Accept'
+    return response
@@ -0,0 +1,305 @@
+"""
+On-demand and sampled profiling of API requests.
+
+With `PROFILING_ENABLED`, a staff user can profile one request by sending an
+`X-Profile` header or a `_profile` query parameter set to:
+
+* `pstats`: run it under cProfile, reporting the top functions.
+* `speedscope`: sample its stack, reporting a https://www.speedscope.app/
+  profile.
+
+The response is then replaced by a report holding the profile, the SQL the
+request ran and its time split between the ORM, serialization and the rest
+(the view logic). Besides, `PROFILING_SAMPLE_RATE` of all requests are
+sampled without changing their response. Every report is kept in a ring
+buffer served at `/profiles/`, and written to `PROFILING_DIR` if set.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import ExitStack
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib import auth
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from api.negotiation import render
+
+
+HEADER = 'HTTP_X_PROFILE'
+PARAM = '_profile'
+MODES = ('pstats', 'speedscope')
+TOP_FUNCTIONS = 50
+
+# Where the time spent in a file goes, first match wins; the rest is `view`
+CATEGORIES = (
+    ('orm', ('/django/db/',)),
+    ('serialization', ('/api/serializers.py', '/api/negotiation.py', '/api/readmodel.py',
+                       '/json/', '/django/core/serializers/', '/msgpack/', '/cbor2/')),
+)
+
+
+def categorize(filename):
+    filename = filename.replace(os.sep, '/')
+    for category, fragments in CATEGORIES:
+        if any(fragment in filename for fragment in fragments):
+            return category
+    return 'view'
+
+
+def is_staff(request):
+    """
+    Whether the request comes from a logged in staff user. The lean API
+    stack has no session or auth middleware, so then the session cookie is
+    looked up here.
+    """
+    user = getattr(request, 'user', None)
+    if user is None:
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return False
+        engine = import_module(settings.SESSION_ENGINE)
+        user = auth.get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    return user.is_active and user.is_staff
+
+
+def requested_mode(request):
+    mode = request.META.get(HEADER) or request.GET.get(PARAM)
+    return mode if mode in MODES else None
+
+
+class SQLRecorder:
+    """`execute_wrapper` keeping each statement run and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'time_ms': (time.perf_counter() - start) * 1000,
+            })
+
+
+class Sampler:
+    """
+    Records the stack of the thread that started it every `interval`
+    seconds, from a background thread.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = []  # (stack as (name, file, line) tuples root first, seconds)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples.append((tuple(reversed(stack)), now - last))
+            last = now
+
+    def time_split(self):
+        split = dict.fromkeys(('orm', 'serialization', 'view'), 0.0)
+        for stack, seconds in self.samples:
+            split[categorize(stack[-1][1])] += seconds
+        return split
+
+    def speedscope(self, name):
+        frames = []
+        index = {}
+        stacks = []
+        for stack, _ in self.samples:
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({'name': key[0], 'file': key[1], 'line': key[2]})
+                ids.append(index[key])
+            stacks.append(ids)
+        weights = [seconds for _, seconds in self.samples]
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': stacks,
+                'weights': weights,
+            }],
+            'name': name,
+            'exporter': 'swapi',
+            'activeProfileIndex': 0,
+        }
+
+
+def cprofile_time_split(stats):
+    split = dict.fromkeys(('orm', 'serialization', 'view'), 0.0)
+    for (filename, _, _), (_, _, tottime, _, callers) in stats.stats.items():
+        if filename == '~' and callers:
+            # Built-ins (e.g. `sqlite3.Cursor.execute`) count for their caller
+            filename = max(callers.items(), key=lambda item: item[1][3])[0][0]
+        split[categorize(filename)] += tottime
+    return split
+
+
+def pstats_text(stats):
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+class ProfileBuffer:
+    """The last `size` reports, by id."""
+
+    def __init__(self, size):
+        self._reports = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        with self._lock:
+            report['id'] = next(self._ids)
+            self._reports.append(report)
+        return report['id']
+
+    def all(self):
+        with self._lock:
+            return list(self._reports)
+
+    def get(self, report_id):
+        with self._lock:
+            for report in self._reports:
+                if report['id'] == report_id:
+                    return report
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._reports.clear()
+
+
+profiles = ProfileBuffer(getattr(settings, 'PROFILING_BUFFER_SIZE', 100))
+
+
+def profile_request(get_response, request, mode):
+    """
+    Run `get_response(request)` under the profiler for `mode`. Returns the
+    response, the report and the `cProfile.Profile` (`None` when sampled).
+    """
+    recorder = SQLRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        start = time.perf_counter()
+        if mode == 'pstats':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(get_response, request)
+        else:
+            profiler = None
+            with Sampler(getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)) as sampler:
+                response = get_response(request)
+        duration = time.perf_counter() - start
+
+    name = '{} {}'.format(request.method, request.get_full_path())
+    if profiler is not None:
+        stats = pstats.Stats(profiler)
+        split, profile = cprofile_time_split(stats), pstats_text(stats)
+    else:
+        split, profile = sampler.time_split(), sampler.speedscope(name)
+    report = OrderedDict([
+        ('id', None),
+        ('request', name),
+        ('status', response.status_code),
+        ('mode', mode),
+        ('duration_ms', duration * 1000),
+        ('time_ms', {category: seconds * 1000 for category, seconds in split.items()}),
+        ('sql_time_ms', sum(query['time_ms'] for query in recorder.queries)),
+        ('sql', recorder.queries),
+        ('profile', profile),
+    ])
+    return response, report, profiler
+
+
+def save_report(report, profiler, directory):
+    """
+    Write `report` to `directory`, with the profile as a `.prof` file for
+    `pstats` or a `.speedscope.json` one. Returns the common path prefix.
+    """
+    base = os.path.join(directory, 'profile-{}-{}'.format(int(time.time()), report['id']))
+    if profiler is not None:
+        profiler.dump_stats(base + '.prof')
+    else:
+        with open(base + '.speedscope.json', 'w') as f:
+            json.dump(report['profile'], f)
+    with open(base + '.json', 'w') as f:
+        json.dump({k: v for k, v in report.items() if k != 'profile'}, f, indent=2)
+    return base
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests asked for by staff users, and a sample of all others,
+    see the module docstring. Not loaded unless `PROFILING_ENABLED`.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request)
+        if mode is not None and not is_staff(request):
+            mode = None
+        sampled = mode is None and random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if mode is None and not sampled:
+            return self.get_response(request)
+
+        response, report, profiler = profile_request(
+            self.get_response, request, mode or 'speedscope')
+        profiles.add(report)
+        directory = getattr(settings, 'PROFILING_DIR', None)
+        saved = save_report(report, profiler, directory) if directory else None
+        if sampled:
+            return response
+        response = render(request, report)
+        if saved:
+            response['X-Profile-Saved'] = saved
+        return response
@@ -0,0 +1,166 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in process memory. Buckets that haven't been used
+    recently are dropped once `max_buckets` is reached.
+    """
+
+    def __init__(self, max_buckets=10000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """
+        Take one token from bucket `key`, refilled at `rate` tokens per second
+        up to `burst`. Returns 0 if allowed, or the seconds to wait otherwise.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets kept in a Django cache backend, so that several worker
+    processes share the same limits. Updates are not atomic across
+    processes, which makes the limit approximate under heavy contention.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        key = 'ratelimit:{}'.format(key)
+        tokens, last = self.cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / rate
+        # Keep the entry only as long as it takes to refill completely.
+        self.cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+        return wait
+
+
+class ConcurrencyLimiter:
+    """
+    Admit at most `limit` concurrent requests. Extra requests wait up to
+    `timeout` seconds for a slot and are rejected after that.
+    """
+
+    def __init__(self, limit, timeout):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self):
+        return self._semaphore.acquire(timeout=self.timeout)
+
+    def release(self):
+        self._semaphore.release()
+
+
+memory_store = MemoryBucketStore()
+
+write_limiter = ConcurrencyLimiter(
+    limit=getattr(settings, 'RATELIMIT_WRITE_CONCURRENCY', 1),
+    timeout=getattr(settings, 'RATELIMIT_WRITE_QUEUE_TIMEOUT', 0.5),
+)
+
+
+def get_store():
+    alias = getattr(settings, 'RATELIMIT_CACHE', None)
+    if alias is None:
+        return memory_store
+    return CacheBucketStore(alias)
+
+
+def get_client_id(request):
+    if getattr(settings, 'RATELIMIT_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+def too_many_requests(retry_after):
+    response = JsonResponse({'msg': 'Too many requests', 'success': False}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_rate(request, route):
+    """
+    Apply the `RATELIMIT_RULES[route]` buckets to this request. Returns the
+    seconds the client has to wait, or 0 if the request is allowed.
+    """
+    rules = getattr(settings, 'RATELIMIT_RULES', {}).get(route)
+    if not rules:
+        return 0
+    store = get_store()
+    wait = 0
+    if 'client' in rules:
+        rate, burst = rules['client']
+        wait = store.take('{}:{}'.format(route, get_client_id(request)), rate, burst)
+    if not wait and 'route' in rules:
+        rate, burst = rules['route']
+        wait = store.take(route, rate, burst)
+    return wait
+
+
+def limit_writes(route):
+    """
+    View decorator applying rate limiting and write admission control to
+    the write methods of a view. Reads are never limited.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in WRITE_METHODS
+                    or not getattr(settings, 'RATELIMIT_ENABLED', True)):
+                return view(request, *args, **kwargs)
+
+            wait = check_rate(request, route)
+            if wait:
+                return too_many_requests(wait)
+
+            # SQLite has a single writer, so queue writes here briefly rather
+            # than have them pile up on the database lock.
+            if not write_limiter.acquire():
+                return too_many_requests(write_limiter.timeout)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                write_limiter.release()
+        return wrapper
+    return decorator
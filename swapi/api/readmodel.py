@@ -0,0 +1,321 @@
+import bisect
+import datetime
+import logging
+import sys
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from api.models import People
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+NULL = -2 ** 63  # stands for NULL in the integer columns
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+RELATIONS = ('films', 'species', 'vehicles', 'starships')
+COLUMNS = ('ids', 'homeworld_ids', 'heights', 'masses', 'created', 'names', 'hair_colors', 'links')
+
+logger = logging.getLogger(__name__)
+
+
+def to_column(value):
+    return NULL if value is None else int(value)
+
+
+def to_microseconds(created):
+    delta = created - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class PeopleReadModel:
+    """
+    An in-memory, column oriented copy of the `People` table, used to serve
+    reads without running a query or building a model instance per row.
+
+    Integer fields live in `array` columns (NULL as a sentinel), strings are
+    interned so repeated values such as hair colors are stored once, and
+    link lists are only stored for the people that have any. Rows are kept
+    sorted by id.
+
+    Reloads build a new copy aside and swap it in, so readers keep using
+    the current one meanwhile, and a reload that fails changes nothing.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()  # one reload at a time
+        self._pending = None  # writes made during a reload, replayed on the new copy
+        self.loaded_at = None
+        self._clear()
+
+    def _clear(self):
+        self.ids = array('q')
+        self.homeworld_ids = array('q')
+        self.heights = array('q')
+        self.masses = array('q')
+        self.created = array('q')  # microseconds since the epoch
+        self.names = []
+        self.hair_colors = []
+        self.links = {relation: {} for relation in RELATIONS}
+
+    def reset(self):
+        """Drop everything; the next `get_read_model()` reloads."""
+        with self._lock:
+            self._clear()
+            self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Loading and keeping up to date
+
+    def load(self):
+        """(Re)load every row with one query per table."""
+        with self._load_lock:
+            self._load()
+
+    def ensure_loaded(self):
+        with self._load_lock:
+            if not self.loaded:
+                self._load()
+
+    def reload_in_background(self):
+        """
+        Start reloading in a thread, away from the request (and its
+        deadline) that found the copy stale, unless a reload is running.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._load()
+            except Exception:
+                logger.exception('Reloading the People read model failed')
+            finally:
+                self._load_lock.release()
+                connection.close()  # this thread's
+        threading.Thread(target=run, daemon=True).start()
+
+    def _load(self):
+        with self._lock:
+            self._pending = []
+        try:
+            fresh = PeopleReadModel()
+            fresh.load_from_db()
+            with self._lock:
+                for method, args in self._pending:
+                    getattr(fresh, method)(*args)
+                for name in COLUMNS:
+                    setattr(self, name, getattr(fresh, name))
+                self.loaded_at = fresh.loaded_at
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def load_from_db(self):
+        """Fill a new copy, not yet shared, with one query per table."""
+        rows = People.objects.order_by('id').values_list(
+            'id', 'name', 'homeworld_id', 'height', 'mass', 'hair_color', 'created')
+        links = {}
+        for relation in RELATIONS:
+            through = getattr(People, relation).through
+            column = through._meta.get_field(relation_field(relation)).attname
+            links[relation] = through.objects.order_by('people_id', column).values_list(
+                'people_id', column)
+        self.load_rows(rows.iterator(), {k: v.iterator() for k, v in links.items()})
+
+    def load_rows(self, rows, links=None):
+        """
+        Replace the contents with `rows` of `(id, name, homeworld_id, height,
+        mass, hair_color, created)` sorted by id, and `links` mapping each
+        relation to `(people_id, related_id)` pairs.
+        """
+        with self._lock:
+            self._clear()
+            for row in rows:
+                self._append(row)
+            for relation, pairs in (links or {}).items():
+                grouped = self.links[relation]
+                for people_id, related_id in pairs:
+                    grouped.setdefault(people_id, []).append(related_id)
+                for people_id, related_ids in grouped.items():
+                    grouped[people_id] = tuple(related_ids)
+            self.loaded_at = time.monotonic()
+
+    def _append(self, row, index=None):
+        people_id, name, homeworld_id, height, mass, hair_color, created = row
+        values = (
+            (self.ids, people_id),
+            (self.homeworld_ids, homeworld_id),
+            (self.heights, to_column(height)),
+            (self.masses, to_column(mass)),
+            (self.created, to_microseconds(created)),
+            (self.names, sys.intern(name)),
+            (self.hair_colors, hair_color and sys.intern(hair_color)),
+        )
+        for column, value in values:
+            if index is None:
+                column.append(value)
+            else:
+                column.insert(index, value)
+
+    def _index(self, people_id):
+        index = bisect.bisect_left(self.ids, people_id)
+        if index < len(self.ids) and self.ids[index] == people_id:
+            return index
+        return None
+
+    def upsert(self, people):
+        row = (people.id, people.name, people.homeworld_id, people.height,
+               people.mass, people.hair_color, people.created)
+        with self._lock:
+            self._record('upsert', people)
+            index = self._index(people.id)
+            if index is not None:
+                self._remove_at(index)
+            self._append(row, index=bisect.bisect_left(self.ids, people.id))
+
+    def remove(self, people_id):
+        with self._lock:
+            self._record('remove', people_id)
+            index = self._index(people_id)
+            if index is not None:
+                self._remove_at(index)
+            for grouped in self.links.values():
+                grouped.pop(people_id, None)
+
+    def _record(self, method, *args):
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def _remove_at(self, index):
+        for column in (self.ids, self.homeworld_ids, self.heights, self.masses,
+                       self.created, self.names, self.hair_colors):
+            del column[index]
+
+    def set_links(self, people_id, relation, related_ids):
+        with self._lock:
+            self._record('set_links', people_id, relation, related_ids)
+            if related_ids:
+                self.links[relation][people_id] = tuple(sorted(related_ids))
+            else:
+                self.links[relation].pop(people_id, None)
+
+    # Reads
+
+    def serialize(self, index, links):
+        """Same output as `serialize_people_as_json`, from row `index`."""
+        people_id = self.ids[index]
+        height = self.heights[index]
+        mass = self.masses[index]
+        created = EPOCH + datetime.timedelta(microseconds=self.created[index])
+        return {
+            'name': self.names[index],
+            'homeworld': links.planet(self.homeworld_ids[index]),
+            'height': None if height == NULL else height,
+            'mass': None if mass == NULL else mass,
+            'hair_color': self.hair_colors[index],
+            'created': created.isoformat(),
+            'url': links.people(people_id),
+            'films': [links.film(i) for i in self.links['films'].get(people_id, ())],
+            'species': [links.species(i) for i in self.links['species'].get(people_id, ())],
+            'vehicles': [links.vehicle(i) for i in self.links['vehicles'].get(people_id, ())],
+            'starships': [links.starship(i) for i in self.links['starships'].get(people_id, ())],
+        }
+
+    def get(self, people_id, links):
+        with self._lock:
+            index = self._index(people_id)
+            return None if index is None else self.serialize(index, links)
+
+    def get_many(self, people_ids, links):
+        """Serialized rows found for `people_ids`, keyed by id."""
+        with self._lock:
+            found = {}
+            for people_id in people_ids:
+                index = self._index(people_id)
+                if index is not None:
+                    found[people_id] = self.serialize(index, links)
+            return found
+
+    def filter(self, links, homeworld_id=None, hair_color=None):
+        """Serialized rows, optionally filtered by homeworld and hair color."""
+        with self._lock:
+            if homeworld_id is None and hair_color is None:
+                indexes = range(len(self.ids))
+            elif numpy is not None and hair_color is None:
+                # Vectorized scan over the column, without copying it
+                column = numpy.frombuffer(self.homeworld_ids, dtype=numpy.int64)
+                indexes = numpy.flatnonzero(column == homeworld_id).tolist()
+                # While the view exists the array can't be resized by writes
+                del column
+            else:
+                indexes = [
+                    i for i in range(len(self.ids))
+                    if (homeworld_id is None or self.homeworld_ids[i] == homeworld_id)
+                    and (hair_color is None or self.hair_colors[i] == hair_color)
+                ]
+            return [self.serialize(i, links) for i in indexes]
+
+    def column_snapshot(self):
+        """`height` and `mass` columns with nulls dropped, as in `stats`."""
+        with self._lock:
+            return ([h for h in self.heights if h != NULL],
+                    [m for m in self.masses if m != NULL])
+
+    def memory_usage(self):
+        """
+        Approximate bytes held, counting each distinct string once.
+        """
+        with self._lock:
+            total = sum(
+                sys.getsizeof(column)
+                for column in (self.ids, self.homeworld_ids, self.heights,
+                               self.masses, self.created, self.names, self.hair_colors))
+            strings = {id(s): s for s in self.names + self.hair_colors if s is not None}
+            total += sum(sys.getsizeof(s) for s in strings.values())
+            for grouped in self.links.values():
+                total += sys.getsizeof(grouped)
+                total += sum(sys.getsizeof(ids) for ids in grouped.values())
+            return total
+
+
+def relation_field(relation):
+    """Name of the through table column pointing at the related model."""
+    return getattr(People, relation).field.m2m_reverse_field_name()
+
+
+people_read_model = PeopleReadModel()
+
+
+def get_read_model():
+    """
+    The loaded read model, or `None` unless `PEOPLE_READ_MODEL` is enabled.
+
+    Each process keeps its own copy, updated by the writes it performs. With
+    several worker processes, `PEOPLE_READ_MODEL_MAX_AGE` bounds how long
+    writes made by other workers can go unseen.
+    """
+    if not getattr(settings, 'PEOPLE_READ_MODEL', False):
+        return None
+    max_age = getattr(settings, 'PEOPLE_READ_MODEL_MAX_AGE', None)
+    model = people_read_model
+    if not model.loaded:
+        model.ensure_loaded()
+    elif max_age is not None and time.monotonic() - model.loaded_at > max_age:
+        # Serve the stale copy until the new one is swapped in
+        model.reload_in_background()
+    return model
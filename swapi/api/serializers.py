@@ -1,11 +1,137 @@
+import json
 
+from api.links import get_link_builder
+from api.models import People
+from api.readmodel import RELATIONS, relation_field
 
-def serialize_people_as_json(people):
+
+# Link lists of people that were just created
+NO_LINKS = {relation: {} for relation in RELATIONS}
+
+
+def people_links(**filters):
+    """
+    Ids of the objects linked to the people matching `filters` (lookups on
+    the through tables, e.g. `people_id__in=ids` or
+    `people__homeworld_id=1`), as `{relation: {people_id: [ids]}}`.
+
+    Only ids are needed to build links, so this is one `values_list()`
+    query per relation, without a model instance or related manager per row.
+    """
+    related = {}
+    for relation in RELATIONS:
+        through = getattr(People, relation).through
+        column = through._meta.get_field(relation_field(relation)).attname
+        grouped = related[relation] = {}
+        rows = through.objects.filter(**filters).order_by(column).values_list('people_id', column)
+        for people_id, related_id in rows:
+            grouped.setdefault(people_id, []).append(related_id)
+    return related
+
+
+def serialize_people_fields(people, links=None):
+    """The fields of `serialize_people_as_json` that need no query, i.e. all but the link lists."""
+    if links is None:
+        links = get_link_builder()
     return {
         'name': people.name,
-        'homeworld': 'http://localhost:8000/planets/{}/'.format(people.homeworld.id),
+        'homeworld': links.planet(people.homeworld_id),
         'height': people.height,
         'mass': people.mass,
         'hair_color': people.hair_color,
         'created': people.created.isoformat(),
+        'url': links.people(people.id),
+    }
+
+
+def serialize_people_as_json(people, links=None, related=None):
+    """
+    `related` is the `people_links()` of a set of people including this
+    one. Without it, the links of this one are queried.
+    """
+    if links is None:
+        links = get_link_builder()
+    if related is None:
+        related = people_links(people_id=people.id)
+    data = serialize_people_fields(people, links)
+    data['films'] = [links.film(i) for i in related['films'].get(people.id, ())]
+    data['species'] = [links.species(i) for i in related['species'].get(people.id, ())]
+    data['vehicles'] = [links.vehicle(i) for i in related['vehicles'].get(people.id, ())]
+    data['starships'] = [links.starship(i) for i in related['starships'].get(people.id, ())]
+    return data
+
+
+def serialize_planet_as_json(planet, links=None):
+    if links is None:
+        links = get_link_builder()
+    return {
+        'name': planet.name,
+        'population': planet.population,
+        'diameter': planet.diameter,
+        'url': links.planet(planet.id),
+    }
+
+
+def serialize_film_as_json(film, links=None):
+    if links is None:
+        links = get_link_builder()
+    return {
+        'title': film.title,
+        'episode_id': film.episode_id,
+        'director': film.director,
+        'release_date': film.release_date.isoformat() if film.release_date else None,
+        'url': links.film(film.id),
+    }
+
+
+def serialize_species_as_json(species, links=None):
+    if links is None:
+        links = get_link_builder()
+    return {
+        'name': species.name,
+        'classification': species.classification,
+        'language': species.language,
+        'url': links.species(species.id),
+    }
+
+
+def serialize_vehicle_as_json(vehicle, links=None):
+    if links is None:
+        links = get_link_builder()
+    return {
+        'name': vehicle.name,
+        'model': vehicle.model,
+        'vehicle_class': vehicle.vehicle_class,
+        'url': links.vehicle(vehicle.id),
+    }
+
+
+def serialize_starship_as_json(starship, links=None):
+    if links is None:
+        links = get_link_builder()
+    return {
+        'name': starship.name,
+        'model': starship.model,
+        'starship_class': starship.starship_class,
+        'url': links.starship(starship.id),
+    }
+
+
+def serialize_job_as_json(job, links=None):
+    if links is None:
+        links = get_link_builder()
+    url = links.job(job.id)
+    return {
+        'kind': job.kind,
+        'params': json.loads(job.params),
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': None if job.result is None else json.loads(job.result),
+        'result_url': url + 'result/' if job.result_file else None,
+        'error': job.error or None,
+        'created': job.created.isoformat(),
+        'started': job.started and job.started.isoformat(),
+        'finished': job.finished and job.finished.isoformat(),
+        'url': url,
     }
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api.events import people_events
+from api.models import People
+from api.readmodel import RELATIONS, people_read_model, relation_field
+from api.serializers import serialize_people_fields
+from api.stats import update_rollups
+
+
+@receiver(post_save, sender=People)
+def publish_people_saved(sender, instance, created, **kwargs):
+    event_type = 'people.created' if created else 'people.updated'
+    # No link lists: they would cost a query per relation on every write
+    data = {'id': instance.id, 'people': serialize_people_fields(instance)}
+    # Only announce what actually made it to the database.
+    transaction.on_commit(lambda: people_events.publish(event_type, data))
+
+
+@receiver(post_delete, sender=People)
+def publish_people_deleted(sender, instance, **kwargs):
+    data = {'id': instance.id}
+    transaction.on_commit(lambda: people_events.publish('people.deleted', data))
+
+
+def publish_people_links_changed(sender, instance, action, reverse, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    publish_people_saved(People, instance, created=False)
+
+
+for relation in (People.films, People.species, People.vehicles, People.starships):
+    m2m_changed.connect(publish_people_links_changed, sender=relation.through)
+
+
+def rollup_values(people):
+    # Values assigned from a payload may still be strings at this point
+    height = None if people.height is None else int(people.height)
+    mass = None if people.mass is None else int(people.mass)
+    return (people.homeworld_id, people.hair_color, height, mass)
+
+
+@receiver(pre_save, sender=People)
+def remember_rollup_values(sender, instance, raw, **kwargs):
+    # The instance already holds the new values, so read what is stored.
+    instance._rollup_values = None
+    if not instance._state.adding:
+        stored = People.objects.filter(pk=instance.pk).values_list(
+            'homeworld_id', 'hair_color', 'height', 'mass').first()
+        instance._rollup_values = stored
+
+
+@receiver(post_save, sender=People)
+def update_rollups_on_save(sender, instance, **kwargs):
+    update_rollups(getattr(instance, '_rollup_values', None), rollup_values(instance))
+
+
+@receiver(post_delete, sender=People)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    update_rollups(rollup_values(instance), None)
+
+
+@receiver(post_save, sender=People)
+def update_read_model_on_save(sender, instance, **kwargs):
+    if people_read_model.loaded:
+        transaction.on_commit(lambda: people_read_model.upsert(instance))
+
+
+@receiver(post_delete, sender=People)
+def update_read_model_on_delete(sender, instance, **kwargs):
+    if people_read_model.loaded:
+        people_id = instance.id
+        transaction.on_commit(lambda: people_read_model.remove(people_id))
+
+
+def update_read_model_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if not people_read_model.loaded or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    relation = THROUGH_RELATIONS[sender]
+    if not reverse:
+        people_ids = [instance.pk]
+    elif pk_set:
+        people_ids = list(pk_set)  # e.g. `film.characters.add(...)`
+    else:
+        # `film.characters.clear()` doesn't say who was affected
+        transaction.on_commit(people_read_model.load)
+        return
+
+    def refresh():
+        column = sender._meta.get_field(relation_field(relation)).attname
+        for people_id in people_ids:
+            related_ids = sender.objects.filter(people_id=people_id).values_list(column, flat=True)
+            people_read_model.set_links(people_id, relation, list(related_ids))
+    transaction.on_commit(refresh)
+
+
+THROUGH_RELATIONS = {getattr(People, relation).through: relation for relation in RELATIONS}
+
+for through in THROUGH_RELATIONS:
+    m2m_changed.connect(update_read_model_links, sender=through)
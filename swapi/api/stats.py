@@ -0,0 +1,232 @@
+import bisect
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from api.models import People, PeopleRollup
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+ROLLUP_FIELDS = ('count', 'height_sum', 'height_count', 'mass_sum', 'mass_count')
+
+
+def rollup_keys(homeworld_id, hair_color):
+    return (
+        ('all', ''),
+        ('homeworld', str(homeworld_id)),
+        ('hair_color', hair_color or ''),
+    )
+
+
+def contribution(height, mass, sign=1):
+    """The amounts one person adds (or, with `sign=-1`, removes) to a rollup."""
+    return {
+        'count': sign,
+        'height_sum': sign * (height or 0),
+        'height_count': sign * (height is not None),
+        'mass_sum': sign * (mass or 0),
+        'mass_count': sign * (mass is not None),
+    }
+
+
+def apply_delta(key, delta):
+    dimension, value = key
+    updated = PeopleRollup.objects.filter(dimension=dimension, value=value).update(
+        **{field: F(field) + amount for field, amount in delta.items()})
+    if not updated:
+        try:
+            with transaction.atomic():
+                PeopleRollup.objects.create(dimension=dimension, value=value, **delta)
+        except IntegrityError:
+            # Created concurrently by another writer
+            apply_delta(key, delta)
+
+
+def update_rollups(old, new):
+    """
+    Move one person's contribution from the `old` values to the `new` ones.
+    Each is a `(homeworld_id, hair_color, height, mass)` tuple, or `None`
+    for a person being created or deleted.
+    """
+    if old == new:
+        return
+    deltas = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        homeworld_id, hair_color, height, mass = values
+        for key in rollup_keys(homeworld_id, hair_color):
+            for field, amount in contribution(height, mass, sign).items():
+                deltas[key][field] += amount
+
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            if any(delta.values()):
+                apply_delta(key, delta)
+
+
+def group_rollup_amounts(queryset):
+    """
+    What the people in `queryset` add to the rollups, by `(homeworld_id,
+    hair_color)`, with a single grouped query.
+    """
+    groups = queryset.values('homeworld_id', 'hair_color').annotate(
+        count=Count('id'),
+        height_sum=Sum('height'),
+        height_count=Count('height'),
+        mass_sum=Sum('mass'),
+        mass_count=Count('mass'),
+    ).order_by()
+    return {
+        (group['homeworld_id'], group['hair_color']): {
+            field: group[field] or 0 for field in ROLLUP_FIELDS}
+        for group in groups
+    }
+
+
+def rollup_totals(groups, sign=1):
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for (homeworld_id, hair_color), amounts in groups.items():
+        for key in rollup_keys(homeworld_id, hair_color):
+            for field in ROLLUP_FIELDS:
+                totals[key][field] += sign * amounts[field]
+    return totals
+
+
+def update_rollups_in_bulk(old_groups, new_groups):
+    """
+    Move the contribution of a set of people from `old_groups` to
+    `new_groups`, both as returned by `group_rollup_amounts()`.
+    """
+    deltas = rollup_totals(old_groups, -1)
+    for key, amounts in rollup_totals(new_groups).items():
+        for field, amount in amounts.items():
+            deltas[key][field] += amount
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            if any(delta.values()):
+                apply_delta(key, delta)
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup from scratch with a single grouped query.
+    """
+    totals = rollup_totals(group_rollup_amounts(People.objects.all()))
+    with transaction.atomic():
+        PeopleRollup.objects.all().delete()
+        PeopleRollup.objects.bulk_create([
+            PeopleRollup(dimension=dimension, value=value, **fields)
+            for (dimension, value), fields in totals.items()
+        ])
+    return len(totals)
+
+
+def average(total, count):
+    return total / count if count else None
+
+
+def read_stats(links):
+    """
+    People statistics read straight from the rollups.
+    """
+    stats = {
+        'count': 0,
+        'height': {'average': None, 'count': 0},
+        'mass': {'average': None, 'count': 0},
+        'people_per_planet': [],
+        'hair_color': [],
+    }
+    for rollup in PeopleRollup.objects.filter(count__gt=0).order_by('dimension', 'value'):
+        if rollup.dimension == 'all':
+            stats['count'] = rollup.count
+            stats['height'] = {
+                'average': average(rollup.height_sum, rollup.height_count),
+                'count': rollup.height_count,
+            }
+            stats['mass'] = {
+                'average': average(rollup.mass_sum, rollup.mass_count),
+                'count': rollup.mass_count,
+            }
+        elif rollup.dimension == 'homeworld':
+            stats['people_per_planet'].append({
+                'homeworld': links.planet(rollup.value),
+                'count': rollup.count,
+            })
+        elif rollup.dimension == 'hair_color':
+            stats['hair_color'].append({
+                'hair_color': rollup.value or None,
+                'count': rollup.count,
+            })
+    return stats
+
+
+def column_snapshot():
+    """
+    `height` and `mass` of every person as two columns, with nulls dropped.
+    """
+    heights, masses = [], []
+    for height, mass in People.objects.values_list('height', 'mass').iterator():
+        if height is not None:
+            heights.append(height)
+        if mass is not None:
+            masses.append(mass)
+    return heights, masses
+
+
+def percentile(sorted_values, q):
+    # Linear interpolation between closest ranks, same as numpy's default
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def histogram(sorted_values, bins):
+    low, high = sorted_values[0], sorted_values[-1]
+    if low == high:
+        high = low + 1
+    width = (high - low) / bins
+    edges = [low + width * i for i in range(bins)] + [high]
+    counts = []
+    for i in range(bins):
+        # The last bin is closed on the right, like numpy.histogram
+        upper = bisect.bisect_right if i == bins - 1 else bisect.bisect_left
+        counts.append(upper(sorted_values, edges[i + 1]) - bisect.bisect_left(sorted_values, edges[i]))
+    return counts, edges
+
+
+def describe(values, percentiles, bins):
+    if not values:
+        return {'percentiles': {}, 'histogram': {'counts': [], 'edges': []}}
+    if numpy is not None:
+        array = numpy.asarray(values, dtype=numpy.float64)
+        points = numpy.percentile(array, percentiles).tolist()
+        counts, edges = numpy.histogram(array, bins=bins)
+        counts, edges = counts.tolist(), edges.tolist()
+    else:
+        values = sorted(values)
+        points = [percentile(values, q) for q in percentiles]
+        counts, edges = histogram(values, bins)
+    return {
+        'percentiles': {str(q): p for q, p in zip(percentiles, points)},
+        'histogram': {'counts': counts, 'edges': edges},
+    }
+
+
+def distribution(percentiles, bins, snapshot=None):
+    """
+    Percentiles and histograms of `height` and `mass`. Unlike the rollups
+    this scans every row, so it is only computed on request. NumPy is used
+    when installed.
+    """
+    heights, masses = snapshot if snapshot is not None else column_snapshot()
+    return {
+        'height': describe(heights, percentiles, bins),
+        'mass': describe(masses, percentiles, bins),
+    }
@@ -1,11 +1,52 @@
+import hashlib
 import json
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+import warnings
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
 from copy import deepcopy
+from datetime import timedelta
 from freezegun import freeze_time
 
-from django.test import TestCase
+try:
+    import gunicorn
+except ImportError:  # pragma: no cover
+    gunicorn = None
 
-from api.models import Planet, People
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.paginator import UnorderedObjectListWarning
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import OperationalError, connection
+from django.http import JsonResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.deadlines import deadline, get_expiry, get_timeout, metrics as deadline_metrics
+from api.events import EventHub, people_events
+from api.idempotency import store as idempotency_store
+from api.jobs import Runner
+from api.profiling import is_staff, profiles
+from api.models import Film, Job, Planet, People, PeopleRollup, Species, Starship, Vehicle
+from api.ratelimit import MemoryBucketStore, memory_store, write_limiter
+from api.readmodel import get_read_model, people_read_model
+from api.serializers import people_links, serialize_people_as_json
+from api.validation import validate_people
+from api import deadlines, jobs, negotiation, readmodel, stats
+from api.admin import EstimatedCountPaginator, estimate_row_count
+from api.bulk import bulk_update_people
 from api.fixtures import SINGLE_PEOPLE_OBJECT, PEOPLE_OBJECTS
+from swapi.handlers import LeanWSGIHandler, PrefixDispatcher, get_wsgi_application
+from swapi.warmup import warmup
 
 
 class PeopleEndpointTestCase(TestCase):
@@ -45,7 +86,12 @@ class PeopleEndpointTestCase(TestCase):
             'mass': 77,
             'homeworld': 'http://localhost:8000/planets/1/',
             'hair_color': 'blond',
+            'films': [],
+            'species': [],
+            'vehicles': [],
+            'starships': [],
             'created': '2018-04-14T10:15:30+00:00',
+            'url': 'http://localhost:8000/people/1/',
         }
         self.assertEqual(response.json(), expected)
 
@@ -57,26 +103,52 @@ class PeopleEndpointTestCase(TestCase):
         self.assertEqual(len(response.json()), 3)
         expected = [
             {'created': '2018-04-14T10:15:30+00:00',
+             'films': [],
+             'species': [],
+             'vehicles': [],
+             'starships': [],
              'hair_color': 'blond',
              'height': 172,
              'homeworld': 'http://localhost:8000/planets/1/',
              'mass': 77,
-             'name': 'Luke Skywalker'},
+             'name': 'Luke Skywalker',
+             'url': 'http://localhost:8000/people/1/'},
             {'created': '2018-04-14T10:15:30+00:00',
+             'films': [],
+             'species': [],
+             'vehicles': [],
+             'starships': [],
              'hair_color': None,
              'height': 167,
              'homeworld': 'http://localhost:8000/planets/1/',
              'mass': 75,
-             'name': 'C-3PO'},
+             'name': 'C-3PO',
+             'url': 'http://localhost:8000/people/2/'},
             {'created': '2018-04-14T10:15:30+00:00',
+             'films': [],
+             'species': [],
+             'vehicles': [],
+             'starships': [],
              'hair_color': None,
              'height': 96,
              'homeworld': 'http://localhost:8000/planets/2/',
              'mass': 32,
-             'name': 'R2-D2'}
+             'name': 'R2-D2',
+             'url': 'http://localhost:8000/people/3/'}
         ]
         self.assertEqual(response.json(), expected)
 
+    @override_settings(SWAPI_BASE_URL='https://swapi.example.com/api/')
+    def test_detail_with_base_url(self):
+        response = self.client.get('/people/1/')
+        self.assertEqual(response.json()['homeworld'], 'https://swapi.example.com/api/planets/1/')
+        self.assertEqual(response.json()['url'], 'https://swapi.example.com/api/people/1/')
+
+    @override_settings(SWAPI_BASE_URL=None)
+    def test_detail_with_request_base_url(self):
+        response = self.client.get('/people/1/', HTTP_HOST='swapi.example.com')
+        self.assertEqual(response.json()['homeworld'], 'http://swapi.example.com/planets/1/')
+
     @freeze_time('2018-04-14T10:15:30+00:00')
     def test_create(self):
         self.assertEqual(People.objects.count(), 3)
@@ -99,7 +171,12 @@ class PeopleEndpointTestCase(TestCase):
             'mass': 32,
             'homeworld': 'http://localhost:8000/planets/1/',
             'hair_color': 'black',
+            'films': [],
+            'species': [],
+            'vehicles': [],
+            'starships': [],
             'created': '2018-04-14T10:15:30+00:00',
+            'url': 'http://localhost:8000/people/4/',
         }
         self.assertEqual(response.json(), expected)
         self.assertEqual(People.objects.count(), 4)
@@ -143,7 +220,8 @@ class PeopleEndpointTestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'application/json')
         expected = {
             "success": False,
-            "msg": "Provided payload is not valid"
+            "msg": "Provided payload is not valid",
+            "errors": {"height": "A valid integer is required"},
         }
         self.assertEqual(response.json(), expected)
 
@@ -188,7 +266,11 @@ class PeopleEndpointTestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'application/json')
         self.assertEqual(
             response.json(),
-            {'msg': 'Missing field in full update', 'success': False})
+            {'msg': 'Missing field in full update', 'success': False, 'errors': {
+                'homeworld': 'This field is required',
+                'mass': 'This field is required',
+                'hair_color': 'This field is required',
+            }})
 
     def test_full_update_planet_not_found(self):
         payload = {
@@ -224,7 +306,8 @@ class PeopleEndpointTestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'application/json')
         self.assertEqual(
             response.json(),
-            {'msg': 'Provided payload is not valid', 'success': False})
+            {'msg': 'Provided payload is not valid', 'success': False,
+             'errors': {'height': 'A valid integer is required'}})
 
     def test_delete(self):
         self.assertEqual(People.objects.count(), 3)
@@ -257,3 +340,1188 @@ class PeopleEndpointTestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'application/json')
         self.assertEqual(response.json(),
                          {'msg': 'Invalid HTTP method', 'success': False})
+
+
+class RelationsTestCase(TestCase):
+
+    def setUp(self):
+        self.planet = Planet.objects.create(name='Tatooine', population=200000)
+        self.film = Film.objects.create(title='A New Hope', episode_id=4)
+        self.species = Species.objects.create(name='Human')
+        self.vehicle = Vehicle.objects.create(name='Snowspeeder')
+        self.starship = Starship.objects.create(name='X-wing')
+        for i in range(5):
+            person = People.objects.create(name='Person {}'.format(i), homeworld=self.planet)
+            person.films.add(self.film)
+            person.species.add(self.species)
+            person.vehicles.add(self.vehicle)
+            person.starships.add(self.starship)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        with self.assertNumQueries(5):
+            response = self.client.get('/people/')
+        person = response.json()[0]
+        self.assertEqual(person['films'], ['http://localhost:8000/films/{}/'.format(self.film.id)])
+        self.assertEqual(person['species'],
+                         ['http://localhost:8000/species/{}/'.format(self.species.id)])
+        self.assertEqual(person['vehicles'],
+                         ['http://localhost:8000/vehicles/{}/'.format(self.vehicle.id)])
+        self.assertEqual(person['starships'],
+                         ['http://localhost:8000/starships/{}/'.format(self.starship.id)])
+
+    def test_people_links(self):
+        person = People.objects.first()
+        with self.assertNumQueries(4):
+            related = people_links(people_id=person.id)
+        self.assertEqual(related['films'], {person.id: [self.film.id]})
+        self.assertEqual(related['starships'], {person.id: [self.starship.id]})
+        self.assertEqual(serialize_people_as_json(person, related=related),
+                         self.client.get('/people/{}/'.format(person.id)).json())
+
+    def test_writes_do_not_query_links(self):
+        payload = {'name': 'New', 'height': 1, 'mass': 2, 'homeworld': self.planet.id,
+                   'hair_color': 'black'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/people/', data=json.dumps([payload] * 3), content_type='application/json')
+            self.client.post('/people/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()[0]['films'], [])
+        for table in ('api_film', 'api_species', 'api_vehicle', 'api_starship'):
+            self.assertFalse([q for q in queries if table in q['sql']], table)
+
+    def test_resource_endpoints(self):
+        response = self.client.get('/planets/{}/'.format(self.planet.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'name': 'Tatooine',
+            'population': 200000,
+            'diameter': None,
+            'url': 'http://localhost:8000/planets/{}/'.format(self.planet.id),
+        })
+        response = self.client.get('/films/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['title'] for f in response.json()], ['A New Hope'])
+        for resource in ('species', 'vehicles', 'starships'):
+            self.assertEqual(self.client.get('/{}/'.format(resource)).status_code, 200)
+
+    def test_resource_not_found(self):
+        response = self.client.get('/starships/9999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'msg': 'Requested object not found', 'success': False})
+
+    def test_resource_invalid_method(self):
+        response = self.client.delete('/planets/{}/'.format(self.planet.id))
+        self.assertEqual(response.status_code, 400)
+
+
+class PeopleStatsTestCase(TestCase):
+
+    def setUp(self):
+        self.planet1 = Planet.objects.create(name='Tatooine')
+        self.planet2 = Planet.objects.create(name='Alderaan')
+        self.luke = People.objects.create(
+            name='Luke Skywalker', homeworld=self.planet1, height=172, mass=77, hair_color='blond')
+        People.objects.create(name='C-3PO', homeworld=self.planet1, height=167, mass=75)
+        People.objects.create(name='R2-D2', homeworld=self.planet2, height=96)
+
+    def get_stats(self):
+        response = self.client.get('/people/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_stats(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/people/stats/').json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['height'], {'average': (172 + 167 + 96) / 3, 'count': 3})
+        self.assertEqual(data['mass'], {'average': 76, 'count': 2})
+        self.assertEqual(data['people_per_planet'], [
+            {'homeworld': 'http://localhost:8000/planets/{}/'.format(self.planet1.id), 'count': 2},
+            {'homeworld': 'http://localhost:8000/planets/{}/'.format(self.planet2.id), 'count': 1},
+        ])
+        self.assertEqual(data['hair_color'], [
+            {'hair_color': None, 'count': 2},
+            {'hair_color': 'blond', 'count': 1},
+        ])
+
+    def test_stats_follow_updates_and_deletes(self):
+        payload = json.dumps({'hair_color': 'black', 'homeworld': self.planet2.id, 'mass': '80'})
+        self.client.patch('/people/{}/'.format(self.luke.id), data=payload,
+                          content_type='application/json')
+        data = self.get_stats()
+        self.assertEqual(data['mass'], {'average': 77.5, 'count': 2})
+        self.assertEqual([c['count'] for c in data['people_per_planet']], [1, 2])
+        self.assertEqual(data['hair_color'], [
+            {'hair_color': None, 'count': 2},
+            {'hair_color': 'black', 'count': 1},
+        ])
+
+        self.client.delete('/people/{}/'.format(self.luke.id))
+        data = self.get_stats()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['hair_color'], [{'hair_color': None, 'count': 2}])
+
+    def test_rebuild_matches_incremental(self):
+        before = self.get_stats()
+        PeopleRollup.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            stats.rebuild_rollups()
+        people_queries = [q for q in queries if 'FROM "api_people"' in q['sql']]
+        self.assertEqual(len(people_queries), 1)
+        self.assertEqual(self.get_stats(), before)
+
+    def test_distribution(self):
+        response = self.client.get('/people/stats/?distribution=1&percentiles=0,50,100&bins=2')
+        distribution = response.json()['distribution']
+        self.assertEqual(distribution['height']['percentiles'], {'0.0': 96, '50.0': 167, '100.0': 172})
+        self.assertEqual(distribution['height']['histogram'], {'counts': [1, 2], 'edges': [96, 134, 172]})
+        self.assertEqual(distribution['mass']['percentiles']['50.0'], 76)
+
+    def test_distribution_without_numpy(self):
+        snapshot = ([96, 167, 172], [75, 77])
+        numpy, stats.numpy = stats.numpy, None
+        try:
+            pure = stats.distribution([10, 50, 90], 4, snapshot)
+        finally:
+            stats.numpy = numpy
+        self.assertEqual(pure['height']['histogram']['counts'], [1, 0, 0, 2])
+        self.assertAlmostEqual(pure['height']['percentiles']['10'], 110.2)
+        if numpy is not None:
+            self.assertEqual(stats.distribution([10, 50, 90], 4, snapshot), pure)
+
+    def test_invalid_distribution_params(self):
+        response = self.client.get('/people/stats/?distribution=1&bins=zero')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReadModelTestCase(TestCase):
+
+    def setUp(self):
+        people_read_model.reset()
+        self.planet1 = Planet.objects.create(name='Tatooine')
+        self.planet2 = Planet.objects.create(name='Alderaan')
+        self.film1 = Film.objects.create(title='A New Hope')
+        self.film2 = Film.objects.create(title='The Empire Strikes Back')
+        self.luke = People.objects.create(
+            name='Luke Skywalker', homeworld=self.planet1, height=172, mass=77, hair_color='blond')
+        self.luke.films.add(self.film2, self.film1)
+        People.objects.create(name='C-3PO', homeworld=self.planet1, height=167, mass=75)
+        People.objects.create(name='Leia Organa', homeworld=self.planet2, hair_color='brown')
+
+    def tearDown(self):
+        people_read_model.reset()
+
+    def assertSameAsOrm(self, url):
+        expected = self.client.get(url)
+        with override_settings(PEOPLE_READ_MODEL=True):
+            get_read_model()  # loading isn't counted
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+
+    def test_reads_match_orm(self):
+        self.assertSameAsOrm('/people/')
+        self.assertSameAsOrm('/people/{}/'.format(self.luke.id))
+        self.assertSameAsOrm('/people/9999/')
+        self.assertSameAsOrm('/people/?ids={},9999'.format(self.luke.id))
+        self.assertSameAsOrm('/people/?homeworld={}'.format(self.planet1.id))
+        self.assertSameAsOrm('/people/?hair_color=brown')
+        self.assertSameAsOrm('/people/?homeworld={}&hair_color=blond'.format(self.planet1.id))
+        self.assertSameAsOrm('/people/?homeworld=1180591620717411303424')
+        self.assertSameAsOrm('/people/?ids=1,1180591620717411303424')
+
+        numpy, readmodel.numpy = readmodel.numpy, None
+        try:
+            self.assertSameAsOrm('/people/?homeworld={}'.format(self.planet1.id))
+        finally:
+            readmodel.numpy = numpy
+
+    def test_memory_usage(self):
+        with override_settings(PEOPLE_READ_MODEL=True):
+            self.client.get('/people/')
+        self.assertEqual(len(people_read_model), 3)
+        self.assertGreater(people_read_model.memory_usage(), 0)
+
+
+    def test_failed_reload_keeps_current_copy(self):
+        with override_settings(PEOPLE_READ_MODEL=True):
+            get_read_model()
+        steps, deadlines.PROGRESS_STEPS = deadlines.PROGRESS_STEPS, 1
+        try:
+            with self.assertRaises(OperationalError), deadlines.enforce(time.monotonic() - 1):
+                people_read_model.load()
+        finally:
+            deadlines.PROGRESS_STEPS = steps
+        self.assertTrue(people_read_model.loaded)
+        self.assertEqual(len(people_read_model), 3)
+
+
+class ReadModelSyncTestCase(TransactionTestCase):
+
+    def setUp(self):
+        people_read_model.reset()
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.film = Film.objects.create(title='A New Hope')
+
+    def tearDown(self):
+        people_read_model.reset()
+
+    @override_settings(PEOPLE_READ_MODEL=True, PEOPLE_READ_MODEL_MAX_AGE=0)
+    def test_stale_copy_is_reloaded_in_background(self):
+        People.objects.create(name='Luke', homeworld=self.planet)
+        self.assertEqual(self.client.get('/people/').json()[0]['name'], 'Luke')
+        People.objects.update(name='Luke Skywalker')  # no signal, only seen by a reload
+
+        # Served from the stale copy while it reloads
+        self.assertEqual(self.client.get('/people/').json()[0]['name'], 'Luke')
+        with people_read_model._load_lock:
+            pass
+        with self.settings(PEOPLE_READ_MODEL_MAX_AGE=None):
+            self.assertEqual(self.client.get('/people/').json()[0]['name'], 'Luke Skywalker')
+
+    @override_settings(PEOPLE_READ_MODEL=True, PEOPLE_READ_MODEL_MAX_AGE=None)
+    def test_writes_update_read_model(self):
+        self.assertEqual(self.client.get('/people/').json(), [])
+
+        luke = People.objects.create(name='Luke', homeworld=self.planet, height=172)
+        luke.films.add(self.film)
+        self.client.patch('/people/{}/'.format(luke.id), data=json.dumps({'mass': 77}),
+                          content_type='application/json')
+        leia = People.objects.create(name='Leia', homeworld=self.planet)
+        leia.delete()
+
+        with self.assertNumQueries(0):
+            data = self.client.get('/people/').json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['name'], 'Luke')
+        self.assertEqual(data[0]['mass'], 77)
+        self.assertEqual(data[0]['films'], ['http://localhost:8000/films/{}/'.format(self.film.id)])
+
+        self.film.characters.clear()
+        self.assertEqual(self.client.get('/people/{}/'.format(luke.id)).json()['films'], [])
+
+
+class ContentNegotiationTestCase(TestCase):
+
+    def setUp(self):
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.luke = People.objects.create(
+            name='Luke Skywalker', homeworld=self.planet, height=172, mass=77, hair_color='blond')
+
+    def test_parse_accept(self):
+        self.assertEqual(
+            negotiation.parse_accept('application/json;q=0.5, application/msgpack, */*;q=0'),
+            [('application/msgpack', 1.0), ('application/json', 0.5)])
+
+    def test_json_is_the_default(self):
+        for accept in ('', '*/*', 'text/html, application/*;q=0.8'):
+            response = self.client.get('/people/', HTTP_ACCEPT=accept)
+            self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_not_acceptable(self):
+        self.assertEqual(self.client.get('/people/stats/', HTTP_ACCEPT='text/csv').status_code, 406)
+        response = self.client.get('/people/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(response.json()['success'])
+
+    def test_not_acceptable_before_writes(self):
+        payload = json.dumps({
+            'name': 'Leia Organa', 'height': 150, 'mass': 49,
+            'homeworld': self.planet.id, 'hair_color': 'brown'})
+        url = '/people/{}/'.format(self.luke.id)
+        responses = [
+            self.client.post('/people/', data=payload, content_type='application/json',
+                             HTTP_ACCEPT='text/html'),
+            self.client.put(url, data=payload, content_type='application/json',
+                            HTTP_ACCEPT='text/html'),
+            self.client.delete(url, HTTP_ACCEPT='text/html'),
+        ]
+        self.assertEqual([r.status_code for r in responses], [406] * 3)
+        self.assertEqual(list(People.objects.values_list('name', flat=True)), ['Luke Skywalker'])
+
+    @unittest.skipUnless(negotiation.msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        import msgpack
+        expected = self.client.get('/people/{}/'.format(self.luke.id)).json()
+        response = self.client.get(
+            '/people/{}/'.format(self.luke.id), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), expected)
+        response = self.client.get('/people/stats/?distribution=1', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False),
+                         self.client.get('/people/stats/?distribution=1').json())
+
+        payload = msgpack.packb({
+            'name': 'Leia Organa', 'height': 150, 'mass': 49,
+            'homeworld': self.planet.id, 'hair_color': 'brown'})
+        response = self.client.post('/people/', data=payload, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['name'], 'Leia Organa')
+
+        response = self.client.post('/people/', data=b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(),
+                         {'msg': 'Provide a valid MessagePack payload', 'success': False})
+
+    @unittest.skipUnless(negotiation.cbor2, 'cbor2 is not installed')
+    def test_cbor(self):
+        import cbor2
+        expected = self.client.get('/planets/').json()
+        response = self.client.get('/planets/', HTTP_ACCEPT='application/cbor')
+        self.assertEqual(response['Content-Type'], 'application/cbor')
+        self.assertEqual(cbor2.loads(response.content), expected)
+
+
+class AdminTestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.admin)
+        self.tatooine = Planet.objects.create(name='Tatooine')
+        self.alderaan = Planet.objects.create(name='Alderaan')
+        self.luke = People.objects.create(name='Luke Skywalker', homeworld=self.tatooine,
+                                          height=172, hair_color='blond')
+        self.leia = People.objects.create(name='Leia Organa', homeworld=self.alderaan,
+                                          hair_color='brown')
+        self.vader = People.objects.create(name='Darth Vader', homeworld=self.tatooine)
+        self.luke.films.add(Film.objects.create(title='A New Hope'))
+
+    def test_changelist_does_not_count_or_query_per_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/api/people/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Tatooine')
+        sql = [q['sql'] for q in queries]
+        self.assertFalse([q for q in sql if 'COUNT(*)' in q and 'WHERE' not in q])
+        self.assertFalse([q for q in sql if 'FROM "api_planet" WHERE' in q])
+
+    def test_prefix_search(self):
+        response = self.client.get('/admin/api/people/?q=Le')
+        self.assertContains(response, 'Leia Organa')
+        self.assertNotContains(response, 'Luke Skywalker')
+
+    def test_homeworld_autocomplete(self):
+        response = self.client.get('/admin/api/planet/autocomplete/?term=Ald')
+        self.assertEqual([r['text'] for r in response.json()['results']], ['Alderaan'])
+
+    def test_estimated_count(self):
+        self.assertEqual(estimate_row_count(People, 'default'), self.vader.id)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        newest = People.objects.create(name='Han Solo', homeworld=self.tatooine)
+        # Statistics are now stale, the estimate must not hide the new row
+        self.assertEqual(estimate_row_count(People, 'default'), newest.id)
+        paginator = EstimatedCountPaginator(People.objects.filter(hair_color='blond').order_by('id'), 10)
+        self.assertEqual(paginator.count, 1)
+
+    def test_bulk_actions(self):
+        selected = [self.luke.id, self.leia.id]
+        response = self.client.post('/admin/api/people/', {
+            'action': 'set_hair_color_red', '_selected_action': selected})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(People.objects.filter(hair_color='red').count(), 2)
+        self.assertRollupsMatchRebuild()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/api/people/', {
+                'action': 'bulk_delete_selected', '_selected_action': selected})
+        deletes = [q['sql'] for q in queries
+                   if q['sql'].startswith('DELETE FROM "api_people') and 'rollup' not in q['sql']]
+        self.assertEqual(len(deletes), 5)  # four link tables and People
+        self.assertEqual(list(People.objects.all()), [self.vader])
+
+        stats = self.client.get('/people/stats/').json()
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['hair_color'], [{'hair_color': None, 'count': 1}])
+        self.assertRollupsMatchRebuild()
+
+    def assertRollupsMatchRebuild(self):
+        maintained = self.client.get('/people/stats/').json()
+        stats.rebuild_rollups()
+        self.assertEqual(maintained, self.client.get('/people/stats/').json())
+
+    def test_bulk_update_of_rollup_fields(self):
+        bulk_update_people(People.objects.filter(homeworld=self.tatooine),
+                           homeworld=self.alderaan, height=180)
+        self.assertRollupsMatchRebuild()
+        bulk_update_people(People.objects.all(), mass=None, height=None)
+        self.assertRollupsMatchRebuild()
+
+    def test_changelist_is_ordered(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            self.assertEqual(self.client.get('/admin/api/people/?p=0').status_code, 200)
+            self.client.get('/admin/api/planet/autocomplete/?term=A')
+
+
+class ValidationTestCase(TestCase):
+
+    def setUp(self):
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.person = People.objects.create(
+            name='Luke Skywalker', homeworld=self.planet, height=172, hair_color='blond')
+
+    def post(self, path, payload):
+        return self.client.post(path, data=json.dumps(payload), content_type='application/json')
+
+    def test_validate_people(self):
+        cleaned, errors = validate_people({
+            'name': 'Han Solo', 'homeworld': '1', 'height': ' 180 ', 'mass': None,
+            'hair_color': 'brown', 'unknown': 'ignored',
+        })
+        self.assertEqual(errors, {})
+        self.assertEqual(cleaned, {
+            'name': 'Han Solo', 'homeworld': 1, 'height': 180, 'mass': None, 'hair_color': 'brown'})
+
+        _, errors = validate_people({
+            'name': 'x' * 256, 'homeworld': None, 'height': True, 'mass': '--5',
+            'hair_color': 'green',
+        })
+        self.assertEqual(errors, {
+            'name': 'Ensure this value has at most 255 characters',
+            'homeworld': 'This field may not be null',
+            'height': 'A valid integer is required',
+            'mass': 'A valid integer is required',
+            'hair_color': 'Must be one of: blond, black, brown, red',
+        })
+        self.assertEqual(validate_people([])[1], {'__all__': 'Expected a JSON object'})
+        self.assertEqual(validate_people({'mass': 2 ** 63}, partial=True)[1], {
+            'mass': 'Ensure this value is within the integer range'})
+
+    def test_invalid_payload_runs_no_queries(self):
+        payload = {'name': 'Han Solo', 'homeworld': self.planet.id, 'height': 180,
+                   'mass': 80, 'hair_color': 'green'}
+        with self.assertNumQueries(0):
+            response = self.post('/people/', payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {
+            'hair_color': 'Must be one of: blond, black, brown, red'})
+
+        with self.assertNumQueries(0):
+            response = self.client.patch(
+                '/people/{}/'.format(self.person.id), data=json.dumps({'height': 'tall'}),
+                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(People.objects.get(id=self.person.id).height, 172)
+
+    def test_update_without_payload(self):
+        response = self.client.put('/people/{}/'.format(self.person.id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'__all__': 'Expected a JSON object'})
+
+    def test_bulk_import(self):
+        payload = [
+            {'name': 'Han Solo', 'homeworld': self.planet.id, 'height': 180, 'mass': 80,
+             'hair_color': 'brown'},
+            {'name': 'Leia Organa', 'homeworld': self.planet.id, 'height': None, 'mass': None,
+             'hair_color': None},
+        ]
+        response = self.post('/people/', payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([p['name'] for p in response.json()], ['Han Solo', 'Leia Organa'])
+        self.assertEqual(People.objects.count(), 3)
+
+    def test_bulk_import_is_all_or_nothing(self):
+        valid = {'name': 'Han Solo', 'homeworld': self.planet.id, 'height': 180, 'mass': 80,
+                 'hair_color': 'brown'}
+        response = self.post('/people/', [valid, dict(valid, mass='heavy')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'1': {'mass': 'A valid integer is required'}})
+
+        response = self.post('/people/', [valid, dict(valid, homeworld=9999)])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['msg'], 'Could not find planet with id: 9999')
+        self.assertEqual(People.objects.count(), 1)
+
+    def test_create_planet(self):
+        response = self.post('/planets/', {'name': 'Alderaan', 'population': 2000000000,
+                                           'diameter': None})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'Alderaan')
+        self.assertTrue(Planet.objects.filter(name='Alderaan').exists())
+
+        response = self.post('/planets/', {'name': 'Hoth'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {
+            'population': 'This field is required', 'diameter': 'This field is required'})
+
+        response = self.post('/films/', {'title': 'A New Hope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LeanHandlerTestCase(TestCase):
+
+    def test_api_requests_skip_admin_middleware(self):
+        request = RequestFactory().get('/people/')
+        response = LeanWSGIHandler().get_response(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertFalse(hasattr(request, 'session'))
+
+        full = WSGIHandler().get_response(RequestFactory().get('/people/'))
+        self.assertEqual(full.status_code, 200)
+        self.assertIn('X-Frame-Options', full)
+
+    def test_lean_handler_has_no_admin_urls(self):
+        handler = LeanWSGIHandler()
+        self.assertEqual(handler.get_response(RequestFactory().get('/admin/')).status_code, 404)
+        self.assertEqual(handler.get_response(RequestFactory().get('/training/json')).status_code, 200)
+        # CommonMiddleware still adds the trailing slash
+        self.assertEqual(handler.get_response(RequestFactory().get('/people')).status_code, 301)
+
+    def test_dispatch_by_prefix(self):
+        application = PrefixDispatcher(lambda e, s: 'lean', lambda e, s: 'full', ('/admin',))
+        self.assertEqual(application({'PATH_INFO': '/admin/api/people/'}, None), 'full')
+        self.assertEqual(application({'PATH_INFO': '/admin'}, None), 'full')
+        self.assertEqual(application({'PATH_INFO': '/people/'}, None), 'lean')
+
+        self.assertIsInstance(get_wsgi_application(), PrefixDispatcher)
+        with override_settings(API_MIDDLEWARE=None):
+            self.assertIsInstance(get_wsgi_application(), WSGIHandler)
+
+    @override_settings(PEOPLE_READ_MODEL=True)
+    def test_warmup(self):
+        people_read_model.reset()
+        self.addCleanup(people_read_model.reset)
+        timings = warmup()
+        self.assertEqual(set(timings), {'urls', 'models', 'read_model'})
+        self.assertTrue(people_read_model.loaded)
+
+
+@unittest.skipUnless(gunicorn, 'gunicorn is not installed')
+class GunicornConfigTestCase(SimpleTestCase):
+
+    def load_config(self):
+        from gunicorn.app.base import Application
+
+        class ConfigLoader(Application):
+            def load_config(self):
+                self.load_config_from_file(
+                    os.path.join(settings.BASE_DIR, 'swapi', 'gunicorn_conf.py'))
+
+            def load(self):
+                pass
+
+        return ConfigLoader().cfg
+
+    def test_config_loads(self):
+        cfg = self.load_config()
+        # Resolving the class imports the worker, which fails on unsupported Pythons
+        self.assertEqual(cfg.worker_class.__name__, 'ThreadWorker')
+        self.assertEqual(cfg.threads, 4)
+        self.assertTrue(cfg.preload_app)
+        self.assertTrue(callable(cfg.when_ready))
+
+    def test_environment_overrides(self):
+        with unittest.mock.patch.dict(os.environ, {'GUNICORN_WORKERS': '3', 'GUNICORN_THREADS': '1',
+                                                   'GUNICORN_WORKER_CLASS': 'sync'}):
+            cfg = self.load_config()
+        self.assertEqual(cfg.workers, 3)
+        self.assertEqual(cfg.worker_class.__name__, 'SyncWorker')
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTestCase(TestCase):
+
+    def setUp(self):
+        planet = Planet.objects.create(name='Tatooine')
+        People.objects.create(name='Luke Skywalker', homeworld=planet, height=172)
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        profiles.clear()
+        self.addCleanup(profiles.clear)
+
+    def test_pstats_report(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/people/', HTTP_X_PROFILE='pstats')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['request'], 'GET /people/')
+        self.assertEqual(report['status'], 200)
+        self.assertEqual(set(report['time_ms']), {'orm', 'serialization', 'view'})
+        self.assertGreater(report['time_ms']['orm'], 0)
+        self.assertTrue(any('"api_people"' in query['sql'] for query in report['sql']))
+        self.assertIn('cumulative', report['profile'])
+        self.assertEqual([r['id'] for r in profiles.all()], [report['id']])
+
+    def test_speedscope_report(self):
+        self.client.force_login(self.staff)
+        report = self.client.get('/people/?_profile=speedscope').json()
+        self.assertEqual(report['mode'], 'speedscope')
+        profile = report['profile']['profiles'][0]
+        self.assertEqual(profile['type'], 'sampled')
+        self.assertEqual(len(profile['samples']), len(profile['weights']))
+
+    def test_only_staff_can_profile(self):
+        response = self.client.get('/people/', HTTP_X_PROFILE='pstats')
+        self.assertEqual(response.json()[0]['name'], 'Luke Skywalker')
+        self.assertEqual(profiles.all(), [])
+        self.assertEqual(self.client.get('/profiles/').status_code, 403)
+
+    def test_staff_from_session_cookie(self):
+        # The lean API stack has no auth middleware
+        self.client.force_login(self.staff)
+        request = RequestFactory().get('/people/')
+        request.COOKIES = dict((name, cookie.value) for name, cookie in self.client.cookies.items())
+        self.assertTrue(is_staff(request))
+        self.assertFalse(is_staff(RequestFactory().get('/people/')))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_go_to_ring_buffer(self):
+        response = self.client.get('/people/')
+        self.assertEqual(response.json()[0]['name'], 'Luke Skywalker')
+        self.assertEqual(len(profiles.all()), 1)
+
+        self.client.force_login(self.staff)
+        summaries = self.client.get('/profiles/').json()
+        self.assertEqual(summaries[0]['request'], 'GET /people/')
+        self.assertNotIn('profile', summaries[0])
+        report = self.client.get('/profiles/{}/'.format(summaries[0]['id'])).json()
+        self.assertEqual(report['profile']['exporter'], 'swapi')
+
+    def test_save_to_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.client.force_login(self.staff)
+        with self.settings(PROFILING_DIR=directory):
+            response = self.client.get('/people/', HTTP_X_PROFILE='pstats')
+        base = response['X-Profile-Saved']
+        self.assertTrue(base.startswith(directory))
+        pstats.Stats(base + '.prof')
+        with open(base + '.json') as f:
+            self.assertEqual(json.load(f)['request'], 'GET /people/')
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/people/', HTTP_X_PROFILE='pstats')
+        self.assertEqual(response.json()[0]['name'], 'Luke Skywalker')
+        self.assertEqual(self.client.get('/profiles/').status_code, 404)
+
+
+class InlineExecutor(Executor):
+    """Runs jobs in the test's thread and transaction."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class BrokenExecutor(Executor):
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        return future
+
+
+class JobsTestCase(TestCase):
+
+    def setUp(self):
+        memory_store.clear()
+        self.addCleanup(memory_store.clear)
+        planet = Planet.objects.create(name='Tatooine')
+        People.objects.create(name='Luke Skywalker', homeworld=planet, height=172, hair_color='blond')
+        People.objects.create(name='Leia Organa', homeworld=planet, hair_color='brown')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(JOBS_RESULT_DIR=directory, JOBS_RETRY_DELAY=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def register(self, name, func):
+        jobs.job(name)(func)
+        self.addCleanup(jobs.JOBS.pop, name)
+
+    def post(self, payload):
+        return self.client.post('/jobs/', data=json.dumps(payload), content_type='application/json')
+
+    def test_enqueue(self):
+        response = self.post({'kind': 'export_people', 'params': {'hair_color': 'blond'}})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(job['params'], {'hair_color': 'blond'})
+        self.assertEqual(response['Location'], job['url'])
+        self.assertEqual(self.client.get('/jobs/').json(), [job])
+
+        response = self.post({'kind': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {
+            'kind': 'Must be one of: export_people, rebuild_stats, reindex'})
+        response = self.post({'kind': 'export_people', 'params': {'hair_color': 'green'}})
+        self.assertEqual(response.json()['errors'], {
+            'params': {'hair_color': 'Must be one of: blond, black, brown, red'}})
+
+    def test_export_and_download(self):
+        url = self.post({'kind': 'export_people'}).json()['url']
+        Runner(concurrency=2, poll_interval=0, executor_factory=InlineExecutor).run(once=True)
+
+        job = self.client.get(url).json()
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(job['result'], {'count': 2})
+        response = self.client.get(job['result_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         self.client.get('/people/').json())
+
+    def test_expired_results_are_purged(self):
+        url = self.post({'kind': 'export_people'}).json()['url']
+        Runner(concurrency=1, poll_interval=0, executor_factory=InlineExecutor).run(once=True)
+        job = Job.objects.get()
+        self.assertTrue(os.path.exists(job.result_file))
+
+        Job.objects.update(finished=timezone.now() - timedelta(days=2))
+        Runner(concurrency=1, poll_interval=0, executor_factory=InlineExecutor).run(once=True)
+        self.assertFalse(os.path.exists(job.result_file))
+        self.assertEqual(self.client.get(url + 'result/').status_code, 404)
+
+    def login_staff(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def test_staff_only(self):
+        self.assertEqual(self.post({'kind': 'reindex'}).status_code, 403)
+        job = jobs.enqueue('export_people')
+        self.assertEqual(self.client.delete('/jobs/{}/'.format(job.id)).status_code, 403)
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.PENDING)
+        self.login_staff()
+        self.assertEqual(self.post({'kind': 'reindex'}).status_code, 202)
+
+    def test_enqueue_limits(self):
+        self.login_staff()
+        with self.settings(JOBS_MAX_PENDING=2):
+            self.assertEqual([self.post({'kind': 'reindex'}).status_code for _ in range(3)],
+                             [202, 202, 429])
+            self.assertEqual(self.post({'kind': 'rebuild_stats'}).status_code, 202)
+        with self.settings(RATELIMIT_RULES={'jobs': {'client': (0.01, 1)}}):
+            self.assertEqual(self.post({'kind': 'reindex'}).status_code, 202)
+            self.assertEqual(self.post({'kind': 'reindex'}).status_code, 429)
+
+    def test_result_not_ready(self):
+        url = self.post({'kind': 'export_people'}).json()['url']
+        self.assertEqual(self.client.get(url + 'result/').status_code, 409)
+
+    def test_other_jobs(self):
+        jobs.enqueue('rebuild_stats')
+        jobs.enqueue('reindex')
+        Runner(concurrency=1, poll_interval=0, executor_factory=InlineExecutor).run(once=True)
+        self.assertEqual(
+            list(Job.objects.order_by('id').values_list('status', 'result')),
+            [('succeeded', '{"rollups": 4}'), ('succeeded', '{}')])
+
+    def test_concurrency_limit(self):
+        for _ in range(3):
+            jobs.enqueue('reindex')
+        self.assertEqual(len(jobs.claim(2)), 2)
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 2)
+        self.assertEqual(len(jobs.claim(2)), 1)
+        self.assertEqual(jobs.claim(2), [])
+
+    def test_retries(self):
+        def flaky(context):
+            raise ValueError('boom')
+        self.register('flaky', flaky)
+        job = jobs.enqueue('flaky')
+
+        with self.assertLogs('api.jobs', 'ERROR'):
+            jobs.run_job(jobs.claim(1)[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ('pending', 1, 'ValueError: boom'))
+        with self.assertLogs('api.jobs', 'ERROR'):
+            Runner(concurrency=1, poll_interval=0, executor_factory=InlineExecutor).run(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+
+    def test_retry_after_delay(self):
+        jobs.enqueue('reindex')
+        with self.settings(JOBS_RETRY_DELAY=60):
+            jobs.fail_attempt(jobs.claim(1)[0], 'Worker process died')
+        self.assertEqual(jobs.claim(1), [])
+
+    def test_worker_crash(self):
+        job = jobs.enqueue('reindex')
+        executors = iter([BrokenExecutor(), InlineExecutor()])
+        with self.assertLogs('api.jobs', 'ERROR'):
+            Runner(concurrency=1, poll_interval=0, executor_factory=lambda: next(executors)).run(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ('succeeded', 2, 'Worker process died'))
+
+    def test_cancel(self):
+        self.login_staff()
+        url = self.post({'kind': 'reindex'}).json()['url']
+        response = self.client.delete(url)
+        self.assertEqual(response.json()['status'], 'cancelled')
+        self.assertEqual(jobs.claim(1), [])
+
+        def slow(context):
+            context.check_cancelled(every=0)
+        self.register('slow', slow)
+        job = jobs.enqueue('slow')
+        jobs.claim(1)
+        self.assertEqual(self.client.delete('/jobs/{}/'.format(job.id)).json()['status'], 'running')
+        jobs.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'cancelled')
+
+
+SLOW_SQL = (
+    'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000) '
+    'SELECT count(*) FROM c')
+
+
+class DeadlineTestCase(TestCase):
+
+    def setUp(self):
+        Planet.objects.create(name='Tatooine')
+        deadline_metrics.reset()
+        self.addCleanup(deadline_metrics.reset)
+
+    def test_slow_query_is_interrupted(self):
+        def slow_view(request):
+            with connection.cursor() as cursor:
+                cursor.execute(SLOW_SQL)
+                cursor.fetchone()
+            return JsonResponse({})
+
+        request = RequestFactory().get('/people/', HTTP_X_REQUEST_TIMEOUT='0.1')
+        start = time.monotonic()
+        response = deadline('people')(slow_view)(request)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(json.loads(response.content)['msg'], 'Request deadline of 0.1s exceeded')
+        self.assertEqual(deadline_metrics.snapshot()['people']['timed_out'], 1)
+
+        # The progress handler is gone once the request is over
+        time.sleep(0.1)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM api_planet')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_expired_before_start_is_shed(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/people/', HTTP_X_REQUEST_START='t={:.3f}'.format((time.time() - 60) * 1000))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(deadline_metrics.snapshot()['people'], {
+            'requests': 1, 'shed': 1, 'timed_out': 0})
+
+    def test_routes(self):
+        self.assertEqual(self.client.get('/planets/').status_code, 200)
+        self.assertEqual(self.client.get('/people/stats/').status_code, 200)
+        self.assertEqual(self.client.get('/films/').status_code, 200)
+        metrics = self.client.get('/metrics/deadlines/').json()
+        self.assertEqual(set(metrics), {'people', 'planets'})
+        self.assertEqual(metrics['planets']['requests'], 1)
+
+    def test_timeout_header_is_clamped(self):
+        factory = RequestFactory()
+        self.assertEqual(get_timeout(factory.get('/', HTTP_X_REQUEST_TIMEOUT='1000'), 5, 30), 30)
+        self.assertEqual(get_timeout(factory.get('/', HTTP_X_REQUEST_TIMEOUT='0'), 5, 30), 0.05)
+        self.assertEqual(get_timeout(factory.get('/', HTTP_X_REQUEST_TIMEOUT='soon'), 5, 30), 5)
+        self.assertEqual(get_timeout(factory.get('/'), 5, 30), 5)
+
+    def test_non_finite_timeout_is_ignored(self):
+        factory = RequestFactory()
+        for value in ('nan', 'inf', '-inf'):
+            self.assertEqual(get_timeout(factory.get('/', HTTP_X_REQUEST_TIMEOUT=value), 5, 30), 5)
+        request = factory.get('/', HTTP_X_REQUEST_START='t=nan')
+        self.assertLessEqual(get_expiry(request, 5), time.monotonic() + 5)
+
+
+class BatchEndpointTestCase(TestCase):
+
+    def setUp(self):
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.people = [
+            People.objects.create(name=name, homeworld=self.planet)
+            for name in ('Luke Skywalker', 'C-3PO', 'R2-D2')
+        ]
+
+    def test_list_by_ids(self):
+        ids = [self.people[2].id, 9999, self.people[0].id]
+        with self.assertNumQueries(5):  # people, then one per link list
+            response = self.client.get('/people/?ids={}'.format(','.join(map(str, ids))))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([p['name'] for p in data['results']], ['R2-D2', 'Luke Skywalker'])
+        self.assertEqual(data['missing'], [9999])
+
+    def test_list_by_invalid_ids(self):
+        response = self.client.get('/people/?ids=1,two')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/people/?ids=1,1180591620717411303424')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch(self):
+        payload = [
+            {'method': 'GET', 'path': '/people/{}/'.format(self.people[1].id)},
+            {'method': 'PATCH', 'path': '/people/{}/'.format(self.people[0].id),
+             'body': {'name': 'Luke'}},
+            {'method': 'GET', 'path': '/nowhere/'},
+        ]
+        response = self.client.post(
+            '/batch/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [200, 200, 404])
+        self.assertEqual(results[0]['body']['name'], 'C-3PO')
+        self.assertEqual(People.objects.get(id=self.people[0].id).name, 'Luke')
+
+    def test_atomic_batch_rolls_back(self):
+        payload = {'atomic': True, 'requests': [
+            {'method': 'DELETE', 'path': '/people/{}/'.format(self.people[0].id)},
+            {'method': 'DELETE', 'path': '/people/9999/'},
+            {'method': 'DELETE', 'path': '/people/{}/'.format(self.people[1].id)},
+        ]}
+        response = self.client.post(
+            '/batch/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [409, 404, 424])
+        self.assertTrue(results[0]['body']['rolled_back'])
+        self.assertEqual(People.objects.count(), 3)
+
+    def test_atomic_batch_reports_rolled_back_creates(self):
+        payload = {'atomic': True, 'requests': [
+            {'method': 'GET', 'path': '/people/{}/'.format(self.people[0].id)},
+            {'method': 'POST', 'path': '/people/', 'body': {
+                'name': 'Han Solo', 'height': 180, 'mass': 80,
+                'homeworld': self.planet.id, 'hair_color': 'brown'}},
+            {'method': 'DELETE', 'path': '/people/9999/'},
+        ]}
+        response = self.client.post(
+            '/batch/', data=json.dumps(payload), content_type='application/json')
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [200, 409, 404])
+        self.assertNotIn('url', results[1]['body'])
+        self.assertFalse(People.objects.filter(name='Han Solo').exists())
+
+    def test_batch_invalid_payload(self):
+        response = self.client.post(
+            '/batch/', data=json.dumps({'requests': []}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        payload = [{'method': 'POST', 'path': '/batch/', 'body': []}]
+        response = self.client.post(
+            '/batch/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['status'], 400)
+
+    def test_batch_only_reaches_api_views(self):
+        payload = [{'method': 'GET', 'path': '/admin/'}]
+        response = self.client.post(
+            '/batch/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], 404)
+
+
+class RateLimitTestCase(TestCase):
+
+    def setUp(self):
+        memory_store.clear()
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.payload = json.dumps({
+            'name': 'New people', 'height': 96, 'mass': 32,
+            'homeworld': self.planet.id, 'hair_color': 'black'})
+
+    def tearDown(self):
+        memory_store.clear()
+
+    def test_token_bucket(self):
+        store = MemoryBucketStore()
+        self.assertEqual(store.take('k', 1, 2), 0)
+        self.assertEqual(store.take('k', 1, 2), 0)
+        self.assertGreater(store.take('k', 1, 2), 0)
+        self.assertEqual(store.take('other', 1, 2), 0)
+
+    @override_settings(RATELIMIT_RULES={'people': {'client': (0.01, 2)}})
+    def test_writes_are_limited_per_client(self):
+        for _ in range(2):
+            response = self.client.post(
+                '/people/', data=self.payload, content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            '/people/', data=self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'msg': 'Too many requests', 'success': False})
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        other = self.client.post('/people/', data=self.payload,
+                                 content_type='application/json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 201)
+        # Reads are never limited
+        self.assertEqual(self.client.get('/people/').status_code, 200)
+
+    @override_settings(RATELIMIT_RULES={'people': {'route': (0.01, 1)}})
+    def test_writes_are_limited_per_route(self):
+        self.client.post('/people/', data=self.payload, content_type='application/json')
+        response = self.client.post('/people/', data=self.payload,
+                                    content_type='application/json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+
+    def test_write_concurrency_sheds_load(self):
+        timeout = write_limiter.timeout
+        write_limiter.timeout = 0
+        self.assertTrue(write_limiter.acquire())  # another write in flight
+        try:
+            response = self.client.post(
+                '/people/', data=self.payload, content_type='application/json')
+        finally:
+            write_limiter.release()
+            write_limiter.timeout = timeout
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class IdempotencyTestCase(TestCase):
+
+    def setUp(self):
+        idempotency_store.clear()
+        self.planet = Planet.objects.create(name='Tatooine')
+        self.payload = json.dumps({
+            'name': 'New people', 'height': 96, 'mass': 32,
+            'homeworld': self.planet.id, 'hair_color': 'black'})
+
+    def tearDown(self):
+        idempotency_store.clear()
+
+    def post(self, payload, key):
+        return self.client.post('/people/', data=payload,
+                                content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed(self):
+        first = self.post(self.payload, 'abc')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.post(self.payload, 'abc')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['Vary'], first['Vary'])
+        self.assertEqual(People.objects.count(), 1)
+
+        self.assertEqual(self.post(self.payload, 'other').status_code, 201)
+        self.assertEqual(People.objects.count(), 2)
+
+    def test_replay_keeps_headers(self):
+        payload = json.dumps({'kind': 'rebuild_stats'})
+        first = self.client.post('/jobs/', data=payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post('/jobs/', data=payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Content-Type'], first['Content-Type'])
+        self.assertEqual(Job.objects.count(), 1)
+
+    @unittest.skipUnless(negotiation.msgpack, 'msgpack is not installed')
+    def test_replay_is_rendered_in_the_accepted_format(self):
+        import msgpack
+        first = self.client.post('/people/', data=self.payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='abc', HTTP_ACCEPT='application/msgpack')
+        retry = self.client.post('/people/', data=self.payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='abc', HTTP_ACCEPT='application/json')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Content-Type'], 'application/json')
+        self.assertEqual(retry.json(), msgpack.unpackb(first.content, raw=False))
+        self.assertEqual(People.objects.count(), 1)
+
+    def test_keys_are_scoped_per_client(self):
+        self.assertEqual(self.post(self.payload, 'abc').status_code, 201)
+        other = self.client.post('/people/', data=self.payload, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', other)
+        self.assertEqual(People.objects.count(), 2)
+
+    def test_key_reused_with_different_payload(self):
+        self.post(self.payload, 'abc')
+        response = self.post(json.dumps({'name': 'Other'}), 'abc')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(People.objects.count(), 1)
+
+    def test_concurrent_duplicate_waits_for_original(self):
+        fingerprint = hashlib.sha256(self.payload.encode()).digest()
+        entry, owner = idempotency_store.begin('client:127.0.0.1 /people/ abc', fingerprint)
+        self.assertTrue(owner)
+        original = self.client.get('/people/')  # stands in for the first response
+        timer = threading.Timer(
+            0.1, idempotency_store.finish, args=('client:127.0.0.1 /people/ abc', entry, original))
+        timer.start()
+        response = self.post(self.payload, 'abc')
+        timer.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(People.objects.count(), 0)
+
+
+class EventHubTestCase(TestCase):
+
+    def test_publish_fans_out_to_subscribers(self):
+        hub = EventHub(queue_size=10)
+        first, _ = hub.subscribe()
+        second, _ = hub.subscribe()
+        event = hub.publish('people.created', {'id': 1})
+        self.assertIs(first.queue.get_nowait(), event)
+        self.assertIs(second.queue.get_nowait(), event)
+        self.assertIn(b'event: people.created', event.payload)
+        self.assertIn(b'id: 1', event.payload)
+
+    def test_slow_subscriber_is_evicted(self):
+        hub = EventHub(queue_size=2)
+        slow, _ = hub.subscribe()
+        for i in range(3):
+            hub.publish('people.updated', {'id': i})
+        self.assertTrue(slow.evicted)
+        self.assertEqual(hub.subscriber_count, 0)
+
+    def test_resume_from_last_event_id(self):
+        hub = EventHub(history_size=3)
+        for i in range(5):
+            hub.publish('people.updated', {'id': i})
+        _, backlog = hub.subscribe(last_event_id=3)
+        self.assertEqual([e.id for e in backlog], [4, 5])
+        _, backlog = hub.subscribe(last_event_id=5)
+        self.assertEqual(backlog, [])
+        _, backlog = hub.subscribe(last_event_id=1)  # already out of history
+        self.assertIsNone(backlog)
+
+
+class PeopleEventsEndpointTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.planet = Planet.objects.create(name='Tatooine')
+
+    def test_changes_are_published(self):
+        last_id = people_events.publish('test', {}).id
+        person = People.objects.create(name='Luke Skywalker', homeworld=self.planet)
+        person.name = 'Luke'
+        person.save()
+        person_id = person.id
+        person.delete()
+
+        response = self.client.get(
+            '/people/events/', HTTP_LAST_EVENT_ID=str(last_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        next(stream)  # retry hint
+        events = [next(stream).decode() for _ in range(3)]
+        response.close()
+
+        self.assertIn('event: people.created', events[0])
+        self.assertIn('event: people.updated', events[1])
+        self.assertIn('"name": "Luke"', events[1])
+        self.assertIn('event: people.deleted', events[2])
+        self.assertIn('"id": {}'.format(person_id), events[2])
+
+    def test_invalid_method(self):
+        response = self.client.post('/people/events/')
+        self.assertEqual(response.status_code, 400)
@@ -10,5 +10,26 @@ urlpatterns = [
 
     # actual views
     path('people/<int:people_id>/', views.people_detail_view),
+    path('people/events/', views.people_events_view),
+    path('people/stats/', views.people_stats_view),
     path('people/', views.people_list_view),
+    path('batch/', views.batch_view),
+    path('metrics/deadlines/', views.deadline_metrics_view),
+    path('jobs/<int:job_id>/result/', views.job_result_view),
+    path('jobs/<int:job_id>/', views.job_detail_view),
+    path('jobs/', views.jobs_view),
+    path('profiles/<int:profile_id>/', views.profiles_view),
+    path('profiles/', views.profiles_view),
+
+    # linked resources, read only
+    path('planets/<int:resource_id>/', views.resource_detail_view, {'resource': 'planets'}),
+    path('planets/', views.resource_list_view, {'resource': 'planets'}),
+    path('films/<int:resource_id>/', views.resource_detail_view, {'resource': 'films'}),
+    path('films/', views.resource_list_view, {'resource': 'films'}),
+    path('species/<int:resource_id>/', views.resource_detail_view, {'resource': 'species'}),
+    path('species/', views.resource_list_view, {'resource': 'species'}),
+    path('vehicles/<int:resource_id>/', views.resource_detail_view, {'resource': 'vehicles'}),
+    path('vehicles/', views.resource_list_view, {'resource': 'vehicles'}),
+    path('starships/<int:resource_id>/', views.resource_detail_view, {'resource': 'starships'}),
+    path('starships/', views.resource_list_view, {'resource': 'starships'}),
 ]
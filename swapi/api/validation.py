@@ -0,0 +1,133 @@
+"""
+Payload validation for the write endpoints.
+
+Schemas are declared as dicts of `Field`s and compiled once, at import, into
+plain functions that check and coerce a decoded payload without touching the
+database. Every write path (create, full and partial update, bulk import and
+batch sub-requests) goes through the same compiled validator.
+"""
+from api.models import People
+
+
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1  # SQLite integer range
+
+
+REQUIRED = 'This field is required'
+
+
+class ValidationError(Exception):
+    pass
+
+
+class Field:
+
+    def __init__(self, type, null=False, required=True, max_length=None, choices=None):
+        self.type = type
+        self.null = null
+        self.required = required
+        self.max_length = max_length
+        self.choices = choices
+
+
+def compile_int(field):
+    def check(value):
+        # `bool` is a subclass of `int`, but `true` is not a valid height
+        if type(value) is not int:
+            digits = value.strip() if isinstance(value, str) else ''
+            if digits[:1] == '-':
+                digits = digits[1:]
+            if not digits.isdecimal():
+                raise ValidationError('A valid integer is required')
+            value = int(value)
+        if not INT_MIN <= value <= INT_MAX:
+            raise ValidationError('Ensure this value is within the integer range')
+        return value
+    return check
+
+
+def compile_str(field):
+    max_length = field.max_length
+    choices = frozenset(field.choices) if field.choices is not None else None
+    choices_error = 'Must be one of: {}'.format(', '.join(field.choices or ()))
+
+    def check(value):
+        if type(value) is not str:
+            raise ValidationError('A valid string is required')
+        if max_length is not None and len(value) > max_length:
+            raise ValidationError('Ensure this value has at most {} characters'.format(max_length))
+        if choices is not None and value not in choices:
+            raise ValidationError(choices_error)
+        return value
+    return check
+
+
+def compile_dict(field):
+    def check(value):
+        if type(value) is not dict:
+            raise ValidationError('A JSON object is required')
+        return value
+    return check
+
+
+COMPILERS = {int: compile_int, str: compile_str, dict: compile_dict}
+
+
+def compile_field(field):
+    check = COMPILERS[field.type](field)
+    if not field.null:
+        def check_not_null(value):
+            if value is None:
+                raise ValidationError('This field may not be null')
+            return check(value)
+        return check_not_null
+
+    def check_nullable(value):
+        return None if value is None else check(value)
+    return check_nullable
+
+
+def compile_schema(schema):
+    """
+    Turn `schema` into `validate(payload, partial=False)`, returning the
+    cleaned values and a dict of error messages by field. With `partial`,
+    missing fields are allowed (PATCH), as are those declared with
+    `required=False`. Unknown keys are ignored.
+    """
+    checks = tuple(
+        (name, compile_field(field), field.required) for name, field in schema.items())
+
+    def validate(payload, partial=False):
+        if not isinstance(payload, dict):
+            return None, {'__all__': 'Expected a JSON object'}
+        cleaned = {}
+        errors = {}
+        for name, check, required in checks:
+            if name not in payload:
+                if required and not partial:
+                    errors[name] = REQUIRED
+                continue
+            try:
+                cleaned[name] = check(payload[name])
+            except ValidationError as e:
+                errors[name] = str(e)
+        return cleaned, errors
+    return validate
+
+
+PEOPLE_SCHEMA = {
+    'name': Field(str, max_length=255),
+    'homeworld': Field(int),
+    'height': Field(int, null=True),
+    'mass': Field(int, null=True),
+    'hair_color': Field(
+        str, null=True, max_length=10, choices=[value for value, _ in People.HAIR_COLOR_CHOICES]),
+}
+
+PLANET_SCHEMA = {
+    'name': Field(str, max_length=255),
+    'population': Field(int, null=True),
+    'diameter': Field(int, null=True),
+}
+
+validate_people = compile_schema(PEOPLE_SCHEMA)
+validate_planet = compile_schema(PLANET_SCHEMA)
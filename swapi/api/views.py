@@ -1,12 +1,29 @@
 import json
+import os
 
-from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from api.models import Planet, People
+from api.batch import BatchError, execute_batch, parse_subrequests
+from api.deadlines import deadline, metrics as deadline_metrics
+from api.events import event_stream, people_events
+from api.idempotency import idempotent
+from api.jobs import JOBS, QueueFull, cancel, enqueue, validate_job
+from api.links import get_link_builder
+from api.models import Film, Job, Planet, People, Species, Starship, Vehicle
+from api.negotiation import ParseError, negotiated, parse_body, render
+from api.profiling import is_staff, profiles
 from api.fixtures import SINGLE_PEOPLE_OBJECT, PEOPLE_OBJECTS
-from api.serializers import serialize_people_as_json
+from api.ratelimit import limit_writes
+from api.readmodel import get_read_model
+from api.serializers import (
+    NO_LINKS, people_links, serialize_film_as_json, serialize_job_as_json,
+    serialize_people_as_json, serialize_planet_as_json, serialize_species_as_json,
+    serialize_starship_as_json, serialize_vehicle_as_json)
+from api.stats import distribution, read_stats
+from api.validation import INT_MAX, INT_MIN, REQUIRED, validate_people, validate_planet
 
 
 def single_people(request):
@@ -18,6 +35,10 @@ def list_people(request):
 
 
 @csrf_exempt
+@negotiated
+@idempotent
+@limit_writes('people')
+@deadline('people')
 def people_list_view(request):
     """
     People `list` actions:
@@ -26,7 +47,17 @@ def people_list_view(request):
 
         * GET: Return the list of all `People` objects in the database.
 
+          With `?ids=1,5,9`, only return those objects, in the requested
+          order, together with the list of ids that don't exist.
+
+          `?homeworld=<planet id>` and `?hair_color=<color>` filter the list.
+
         * POST: Create a new `People` object using the submitted JSON payload.
+          Retries sent with the same `Idempotency-Key` header get the
+          original response back instead of creating a duplicate.
+
+          A list of objects is imported in one transaction: either all of
+          them are created or, if any is invalid, none.
 
     Make sure you add at least these validations:
 
@@ -36,42 +67,134 @@ def people_list_view(request):
         * If submited payload is not JSON valid, return a `400` response.
     """
     # Test for valid JSON and type check
+    payload = None
     if request.body:
         try:
-            payload = json.loads(request.body)
-        except json.JSONDecodeError:
-            return JsonResponse({"msg": "Provide a valid JSON payload", 'success': False}, status=400)
+            payload = parse_body(request)
+        except ParseError as e:
+            return render(request, {"msg": str(e), 'success': False}, status=400)
 
     # GET will return a list of all people and POST will create a new person
     # All other methods are forbidden
     if (request.method == 'GET'):
-        people = [serialize_people_as_json(person) for person in People.objects.all()]
-        return JsonResponse(people, safe=False)
+        if 'ids' in request.GET:
+            return people_batch_get(request, request.GET['ids'])
+        filters = {}
+        if 'homeworld' in request.GET:
+            try:
+                filters['homeworld_id'] = int(request.GET['homeworld'])
+                if not INT_MIN <= filters['homeworld_id'] <= INT_MAX:
+                    raise ValueError()
+            except ValueError:
+                return render(request, {'msg': 'Invalid homeworld filter', 'success': False}, status=400)
+        if 'hair_color' in request.GET:
+            filters['hair_color'] = request.GET['hair_color']
+
+        links = get_link_builder(request)
+        read_model = get_read_model()
+        if read_model is not None:
+            people = read_model.filter(links, **filters)
+        else:
+            related = people_links(**{
+                'people__' + name: value for name, value in filters.items()})
+            people = [serialize_people_as_json(person, links, related)
+                      for person in People.objects.filter(**filters)]
+        return render(request, people)
     elif (request.method == 'POST'):
-        homeworld_id = payload['homeworld']
+        if isinstance(payload, list):
+            return people_bulk_import(request, payload)
+        cleaned, errors = validate_people(payload)
+        if errors:
+            return invalid_payload(request, errors)
+        homeworld_id = cleaned.pop('homeworld')
         try:
             homeworld = Planet.objects.get(id=homeworld_id)
         except Planet.DoesNotExist:
-            return JsonResponse({
+            return render(request, {
                 "success": False,
                 "msg": "Could not find planet with id: {}".format(homeworld_id)
             }, status=404)
-        try:
-            new_person = People.objects.create(
-                name=payload['name'],
-                homeworld=homeworld,
-                height=payload['height'],
-                mass=payload['mass'],
-                hair_color=payload['hair_color']
-                )
-            return JsonResponse(serialize_people_as_json(new_person), status=201)
-        except (TypeError, ValueError, KeyError):
-            return JsonResponse({'msg': 'Provided payload is not valid', 'success': False}, status=400)
+        new_person = People.objects.create(homeworld=homeworld, **cleaned)
+        return render(request, serialize_people_as_json(
+            new_person, get_link_builder(request), NO_LINKS), status=201)
     else:
-        return JsonResponse({'msg': 'Invalid HTTP method', 'success': False}, status=400)
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+
+def invalid_payload(request, errors, msg='Provided payload is not valid'):
+    return render(request, {'msg': msg, 'success': False, 'errors': errors}, status=400)
+
+
+def people_bulk_import(request, payload):
+    """
+    Create every `People` object in `payload`, validated with the same
+    schema as single creates, looking up all homeworlds with one query.
+    """
+    max_items = getattr(settings, 'PEOPLE_MAX_IMPORT', 1000)
+    if not payload or len(payload) > max_items:
+        return render(request, {
+            'msg': 'Provide between 1 and {} objects to import'.format(max_items),
+            'success': False
+        }, status=400)
+
+    items = []
+    errors = {}
+    for index, item in enumerate(payload):
+        cleaned, item_errors = validate_people(item)
+        if item_errors:
+            errors[str(index)] = item_errors
+        items.append(cleaned)
+    if errors:
+        return invalid_payload(request, errors)
+
+    planets = Planet.objects.in_bulk({item['homeworld'] for item in items})
+    missing = sorted({item['homeworld'] for item in items} - set(planets))
+    if missing:
+        return render(request, {
+            "success": False,
+            "msg": "Could not find planet with id: {}".format(', '.join(map(str, missing)))
+        }, status=404)
+
+    with transaction.atomic():
+        created = [People.objects.create(homeworld=planets[item.pop('homeworld')], **item)
+                   for item in items]
+    links = get_link_builder(request)
+    return render(request, [
+        serialize_people_as_json(person, links, NO_LINKS) for person in created], status=201)
+
+
+def people_batch_get(request, raw_ids):
+    """
+    Resolve a comma separated list of ids with a single `id__in` query.
+    """
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw_ids.split(',') if i.strip()))
+        if not all(INT_MIN <= i <= INT_MAX for i in ids):
+            raise ValueError()
+    except ValueError:
+        return render(request, {'msg': 'Provide a comma separated list of ids', 'success': False}, status=400)
+    max_ids = getattr(settings, 'PEOPLE_MAX_BATCH_IDS', 500)
+    if len(ids) > max_ids:
+        return render(request, {'msg': 'Too many ids (max {})'.format(max_ids), 'success': False}, status=400)
+
+    links = get_link_builder(request)
+    read_model = get_read_model()
+    if read_model is not None:
+        found = read_model.get_many(ids, links)
+    else:
+        related = people_links(people_id__in=ids)
+        found = {person.id: serialize_people_as_json(person, links, related)
+                 for person in People.objects.filter(id__in=ids)}
+    return render(request, {
+        'results': [found[i] for i in ids if i in found],
+        'missing': [i for i in ids if i not in found],
+    })
 
 
 @csrf_exempt
+@negotiated
+@limit_writes('people')
+@deadline('people')
 def people_detail_view(request, people_id):
     """
     People `detail` actions:
@@ -93,56 +216,318 @@ def people_detail_view(request, people_id):
         * If submited payload is nos JSON valid, return a `400` response.
     """
     # Test for valid JSON and type check
+    payload = None
     if request.body:
         try:
-            payload = json.loads(request.body)
-        except (ValueError, KeyError):
-            return JsonResponse({'msg': 'Provide a valid JSON payload', 'success': False}, status=400)
+            payload = parse_body(request)
+        except ParseError as e:
+            return render(request, {'msg': str(e), 'success': False}, status=400)
+
+    # Reject invalid updates before touching the database. Missing fields
+    # are an error for PUT, ok for PATCH.
+    if (request.method in ['PUT', 'PATCH']):
+        cleaned, errors = validate_people(payload, partial=(request.method == 'PATCH'))
+        if errors:
+            if REQUIRED in errors.values():
+                return invalid_payload(request, errors, msg='Missing field in full update')
+            return invalid_payload(request, errors)
+
+    read_model = get_read_model()
+    if (request.method == 'GET' and read_model is not None):
+        json_person = read_model.get(people_id, get_link_builder(request))
+        if json_person is None:
+            return render(request, {"msg": "Requested person not found", "success": False}, status=404)
+        return render(request, json_person)
 
     # Find the specified person, or return an error if not found
     try:
         queried_person = People.objects.get(id=people_id)
-        json_person = serialize_people_as_json(queried_person)
     except People.DoesNotExist:
-        return JsonResponse({"msg": "Requested person not found", "success": False}, status=404)
+        return render(request, {"msg": "Requested person not found", "success": False}, status=404)
 
     # Process the HTTP request
     if (request.method == 'GET'):
-        return JsonResponse(json_person, safe=False)
+        return render(
+            request, serialize_people_as_json(queried_person, get_link_builder(request)))
     elif (request.method in ['PUT', 'PATCH']):
-        for field in People._meta.get_fields(): # payload.keys():
-            if (field.name == 'created' or field.name =='id'):  # Not user-defined fields
-                continue
-            if (field.name not in payload.keys()):  # Error if fields are missing for PUT, ok for PATCH
-                if request.method == 'PATCH':
-                    continue
-                else:
-                    return JsonResponse({'msg': 'Missing field in full update', 'success': False}, status=400)
-            if field.name == 'homeworld':
-                homeworld_id = payload['homeworld']
-                try:
-                    homeworld = Planet.objects.get(id=homeworld_id)
-                    setattr(queried_person, field.name, homeworld)
-                    queried_person.save()
-                except Planet.DoesNotExist:
-                    return JsonResponse({
-                        "success": False,
-                        "msg": "Could not find planet with id: {}".format(homeworld_id)
-                    }, status=404)
-            else:
-                try:
-                    setattr(queried_person, field.name, payload[field.name])
-                    queried_person.save()
-                except (TypeError, ValueError, KeyError):
-                    return JsonResponse({"success": False, "msg": "Provided payload is not valid"}, status=400)
-        return JsonResponse(serialize_people_as_json(queried_person), status=200)
+        if 'homeworld' in cleaned:
+            homeworld_id = cleaned['homeworld']
+            try:
+                cleaned['homeworld'] = Planet.objects.get(id=homeworld_id)
+            except Planet.DoesNotExist:
+                return render(request, {
+                    "success": False,
+                    "msg": "Could not find planet with id: {}".format(homeworld_id)
+                }, status=404)
+        for name, value in cleaned.items():
+            setattr(queried_person, name, value)
+        # Save once, so an update is a single write (and a single change event)
+        queried_person.save()
+        return render(
+            request, serialize_people_as_json(queried_person, get_link_builder(request)), status=200)
     elif (request.method == 'DELETE'):
         delete_response = queried_person.delete()
         if delete_response[0] > 0:
-            return JsonResponse({'success': True}, status=200)
+            return render(request, {'success': True}, status=200)
         else:
-            return JsonResponse({'Delete Failed': 'Server error'}, status=500)
+            return render(request, {'Delete Failed': 'Server error'}, status=500)
     else:
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+
+@negotiated
+@deadline('people')
+def people_stats_view(request):
+    """
+    GET: Return `People` statistics: total count, `height` and `mass`
+    averages, people per planet and hair color breakdown. These are read from
+    rollups maintained on every write, so the cost doesn't grow with the data.
+
+    With `?distribution=1`, also return percentiles (`?percentiles=50,90`)
+    and histograms (`?bins=10`) of `height` and `mass`, computed over all rows.
+    """
+    if (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+    stats = read_stats(get_link_builder(request))
+    if request.GET.get('distribution'):
+        try:
+            percentiles = [float(q) for q in request.GET.get('percentiles', '25,50,75,90,99').split(',')]
+            bins = int(request.GET.get('bins', 10))
+        except ValueError:
+            return render(request, {'msg': 'Invalid percentiles or bins', 'success': False}, status=400)
+        if not all(0 <= q <= 100 for q in percentiles) or not 1 <= bins <= 1000:
+            return render(request, {'msg': 'Invalid percentiles or bins', 'success': False}, status=400)
+        read_model = get_read_model()
+        snapshot = read_model.column_snapshot() if read_model is not None else None
+        stats['distribution'] = distribution(percentiles, bins, snapshot)
+    return render(request, stats)
+
+
+# Read-only resources linked from `People`: model and serializer by URL name
+# name: (model, serializer, validator used to create objects or None)
+RESOURCES = {
+    'planets': (Planet, serialize_planet_as_json, validate_planet),
+    'films': (Film, serialize_film_as_json, None),
+    'species': (Species, serialize_species_as_json, None),
+    'vehicles': (Vehicle, serialize_vehicle_as_json, None),
+    'starships': (Starship, serialize_starship_as_json, None),
+}
+
+
+@csrf_exempt
+@negotiated
+@limit_writes('resources')
+@deadline()
+def resource_list_view(request, resource):
+    """
+    GET: Return the list of all objects of the given `resource`.
+
+    POST: Create a new object, for the resources that accept writes.
+    """
+    model, serializer, validate = RESOURCES[resource]
+    links = get_link_builder(request)
+    if (request.method == 'GET'):
+        return render(request, [serializer(obj, links) for obj in model.objects.all()])
+    if (request.method != 'POST' or validate is None):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+    try:
+        payload = parse_body(request)
+    except ParseError as e:
+        return render(request, {'msg': str(e), 'success': False}, status=400)
+    cleaned, errors = validate(payload)
+    if errors:
+        return invalid_payload(request, errors)
+    return render(request, serializer(model.objects.create(**cleaned), links), status=201)
+
+
+@negotiated
+@deadline()
+def resource_detail_view(request, resource, resource_id):
+    """
+    GET: Return the object of the given `resource` with id `resource_id`.
+    """
+    if (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+    model, serializer, _ = RESOURCES[resource]
+    try:
+        obj = model.objects.get(id=resource_id)
+    except model.DoesNotExist:
+        return render(request, {'msg': 'Requested object not found', 'success': False}, status=404)
+    return render(request, serializer(obj, get_link_builder(request)))
+
+
+@negotiated
+def deadline_metrics_view(request):
+    """
+    GET: Return, per route, how many requests had a deadline and how many
+    of them were shed (503) or timed out (504).
+    """
+    if (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+    return render(request, deadline_metrics.snapshot())
+
+
+@negotiated
+def profiles_view(request, profile_id=None):
+    """
+    Staff only. GET: Return the summaries of the profiled requests kept in
+    the ring buffer, oldest first, or with `profile_id` the full report.
+    """
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        return render(request, {'msg': 'Profiling is disabled', 'success': False}, status=404)
+    if not is_staff(request):
+        return render(request, {'msg': 'Staff only', 'success': False}, status=403)
+    if (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+    if profile_id is None:
+        return render(request, [
+            {key: value for key, value in report.items() if key not in ('sql', 'profile')}
+            for report in profiles.all()
+        ])
+    report = profiles.get(profile_id)
+    if report is None:
+        return render(request, {'msg': 'Requested object not found', 'success': False}, status=404)
+    return render(request, report)
+
+
+def people_events_view(request):
+    """
+    Stream `People` changes as Server-Sent Events.
+
+    Every create/update/delete committed through the API or the admin is
+    pushed as a `people.created`, `people.updated` or `people.deleted` event.
+    Clients that reconnect with a `Last-Event-ID` header (or `last_event_id`
+    query param) receive the events they missed, or a `reset` event if they
+    have to refetch the list.
+    """
+    if (request.method != 'GET'):
+        return JsonResponse({'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return JsonResponse({'msg': 'Invalid Last-Event-ID', 'success': False}, status=400)
+
+    heartbeat = getattr(settings, 'PEOPLE_EVENTS_HEARTBEAT', 15)
+    response = StreamingHttpResponse(
+        event_stream(people_events, last_event_id, heartbeat),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+
+@csrf_exempt
+@idempotent
+def batch_view(request):
+    """
+    Execute several API requests in a single HTTP round trip.
+
+    The POST payload is a list of `{"method", "path", "body"}` objects, or
+    `{"atomic": true, "requests": [...]}` to run all of them inside one
+    transaction. Returns the status and body of every sub-request in order.
+    """
+    if (request.method != 'POST'):
         return JsonResponse({'msg': 'Invalid HTTP method', 'success': False}, status=400)
+    try:
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"msg": "Provide a valid JSON payload", 'success': False}, status=400)
 
+    try:
+        subrequests, atomic = parse_subrequests(
+            payload, getattr(settings, 'BATCH_MAX_REQUESTS', 50))
+    except BatchError as e:
+        return JsonResponse({'msg': str(e), 'success': False}, status=400)
+
+    results = execute_batch(
+        request, subrequests, atomic=atomic,
+        excluded_views=(batch_view, people_events_view, job_result_view))
+    return JsonResponse({'results': results})
+
+
+@csrf_exempt
+@negotiated
+@idempotent
+@limit_writes('jobs')
+def jobs_view(request):
+    """
+    * GET: Return the latest jobs, newest first.
+
+    * POST: Enqueue a `{"kind": ..., "params": {...}}` job for
+      `manage.py run_jobs`. Responds `202` with the job, whose `url` can be
+      polled for its status. Some kinds (e.g. `reindex`) are staff only.
+    """
+    links = get_link_builder(request)
+    if (request.method == 'GET'):
+        return render(request, [
+            serialize_job_as_json(job, links) for job in Job.objects.order_by('-id')[:100]])
+    if (request.method != 'POST'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+
+    try:
+        payload = parse_body(request)
+    except ParseError as e:
+        return render(request, {'msg': str(e), 'success': False}, status=400)
+    cleaned, errors = validate_job(payload)
+    if errors:
+        return invalid_payload(request, errors)
+    if JOBS[cleaned[0]].staff_only and not is_staff(request):
+        return render(request, {'msg': 'Staff only', 'success': False}, status=403)
+    try:
+        job = enqueue(*cleaned)
+    except QueueFull as e:
+        return render(request, {'msg': str(e), 'success': False}, status=429)
+    response = render(request, serialize_job_as_json(job, links), status=202)
+    response['Location'] = links.job(job.id)
+    return response
 
+
+@csrf_exempt
+@negotiated
+@limit_writes('jobs')
+def job_detail_view(request, job_id):
+    """
+    * GET: Return the job with id `job_id`.
+
+    * DELETE: Staff only. Cancel it. A pending job is cancelled right away,
+      a running one stops at its next check.
+    """
+    if (request.method == 'DELETE'):
+        if not is_staff(request):
+            return render(request, {'msg': 'Staff only', 'success': False}, status=403)
+        cancel(job_id)
+    elif (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+    try:
+        job = Job.objects.get(id=job_id)
+    except Job.DoesNotExist:
+        return render(request, {'msg': 'Requested object not found', 'success': False}, status=404)
+    return render(request, serialize_job_as_json(job, get_link_builder(request)))
+
+
+def job_result_view(request, job_id):
+    """
+    GET: Download the file produced by the job with id `job_id`.
+    """
+    if (request.method != 'GET'):
+        return render(request, {'msg': 'Invalid HTTP method', 'success': False}, status=400)
+    try:
+        job = Job.objects.get(id=job_id)
+    except Job.DoesNotExist:
+        return render(request, {'msg': 'Requested object not found', 'success': False}, status=404)
+    if not job.result_file:
+        return render(request, {
+            'msg': 'Job {} has no result file, it is {}'.format(job.id, job.status),
+            'success': False
+        }, status=409 if job.status in (Job.PENDING, Job.RUNNING) else 404)
+    try:
+        result = open(job.result_file, 'rb')
+    except FileNotFoundError:
+        return render(request, {'msg': 'The result file was deleted', 'success': False}, status=410)
+    return FileResponse(result, as_attachment=True, filename=os.path.basename(job.result_file))
@@ -0,0 +1,11 @@
+"""
+URLs served by the lean API handler (see `swapi.handlers`): the same as
+`swapi.urls` without the admin, which is never routed there.
+"""
+from django.urls import path, include
+
+
+urlpatterns = [
+    path('training/', include('training.urls')),
+    path('', include('api.urls')),
+]
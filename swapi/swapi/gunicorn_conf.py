@@ -0,0 +1,72 @@
+"""
+Gunicorn configuration for serving `swapi.wsgi` in production: `make serve`.
+
+The application is imported and warmed up once in the master (`preload_app`)
+and the workers are forked from it, sharing its memory copy-on-write. Every
+value can be overridden with a `GUNICORN_*` environment variable, e.g.
+`GUNICORN_WORKERS=8 make serve`.
+
+Reload gracefully with `make reload` (SIGHUP): new workers are started with
+the current configuration and the old ones finish their requests. With a
+preloaded app, code changes need a full restart.
+"""
+import multiprocessing
+import os
+import time
+
+
+def env(name, default, cast=str):
+    value = os.environ.get('GUNICORN_' + name)
+    return default if value is None else cast(value)
+
+
+bind = env('BIND', '0.0.0.0:8080')
+pidfile = env('PIDFILE', '/tmp/swapi-gunicorn.pid')
+
+preload_app = True
+workers = env('WORKERS', multiprocessing.cpu_count() * 2 + 1, int)
+# Threaded workers, so idle keep-alive connections and event streams don't
+# each hold a whole process
+worker_class = env('WORKER_CLASS', 'gthread')
+threads = env('THREADS', 4, int)
+
+# Recycle workers after this many requests (with jitter, so they don't all
+# restart together) to bound the effect of leaks
+max_requests = env('MAX_REQUESTS', 5000, int)
+max_requests_jitter = env('MAX_REQUESTS_JITTER', 500, int)
+
+keepalive = env('KEEPALIVE', 5, int)  # seconds, behind a load balancer raise it above its idle timeout
+timeout = env('TIMEOUT', 30, int)
+graceful_timeout = env('GRACEFUL_TIMEOUT', 30, int)
+
+accesslog = env('ACCESSLOG', '-')
+loglevel = env('LOGLEVEL', 'info')
+
+
+# Startup timing. Cold start is from loading this file until the master is
+# ready to fork (mostly importing and warming up the preloaded app, which
+# happens before `on_starting`); per-worker warmup is from fork until the
+# worker accepts requests.
+
+started_at = time.perf_counter()
+
+
+def when_ready(server):
+    from django.db import connections
+    from swapi.wsgi import startup_timings
+
+    # Workers are forked next; they must not share the master's connection
+    connections.close_all()
+
+    server.log.info('Cold start %.1f ms (warmup: %s)', (time.perf_counter() - started_at) * 1000,
+                    ', '.join('{} {:.1f} ms'.format(step, seconds * 1000)
+                              for step, seconds in startup_timings.items()))
+
+
+def pre_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s ready in %.1f ms', worker.pid,
+                    (time.perf_counter() - worker.forked_at) * 1000)
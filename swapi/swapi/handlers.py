@@ -0,0 +1,102 @@
+"""
+WSGI handlers giving the API a lighter request path than the admin.
+
+The API views are stateless and `@csrf_exempt`, so sessions, CSRF, auth and
+messages only cost them time. `get_wsgi_application()` serves requests whose
+path starts with one of `FULL_MIDDLEWARE_PREFIXES` with the usual handler
+and everything else with `LeanWSGIHandler`, which runs `API_MIDDLEWARE` and
+resolves against `API_URLCONF`.
+"""
+import logging
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('django.request')
+
+
+class LeanWSGIHandler(WSGIHandler):
+    """
+    A `WSGIHandler` built from `middleware` instead of `settings.MIDDLEWARE`,
+    resolving every request against `urlconf`.
+    """
+
+    def __init__(self, middleware=None, urlconf=None):
+        self.middleware = settings.API_MIDDLEWARE if middleware is None else middleware
+        self.urlconf = urlconf or getattr(settings, 'API_URLCONF', settings.ROOT_URLCONF)
+        super().__init__()
+
+    def load_middleware(self):
+        # Same as `BaseHandler.load_middleware`, reading `self.middleware`
+        self._request_middleware = []
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(self.middleware):
+            middleware = import_string(middleware_path)
+            try:
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed as exc:
+                if settings.DEBUG:
+                    if str(exc):
+                        logger.debug('MiddlewareNotUsed(%r): %s', middleware_path, exc)
+                    else:
+                        logger.debug('MiddlewareNotUsed: %r', middleware_path)
+                continue
+
+            if mw_instance is None:
+                raise ImproperlyConfigured(
+                    'Middleware factory %s returned None.' % middleware_path)
+
+            if hasattr(mw_instance, 'process_view'):
+                self._view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_template_response'):
+                self._template_response_middleware.append(mw_instance.process_template_response)
+            if hasattr(mw_instance, 'process_exception'):
+                self._exception_middleware.append(mw_instance.process_exception)
+
+            handler = convert_exception_to_response(mw_instance)
+
+        self._middleware_chain = handler
+
+    def get_response(self, request):
+        # Read by `_get_response` when resolving, and set as the thread's
+        # urlconf so `reverse()` and `/batch/` sub-requests agree with it.
+        request.urlconf = self.urlconf
+        return super().get_response(request)
+
+
+class PrefixDispatcher:
+    """
+    WSGI application passing requests whose path starts with one of
+    `prefixes` to `full`, and all the others to `lean`.
+    """
+
+    def __init__(self, lean, full, prefixes):
+        self.lean = lean
+        self.full = full
+        self.prefixes = tuple(prefixes)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.prefixes):
+            return self.full(environ, start_response)
+        return self.lean(environ, start_response)
+
+
+def get_wsgi_application():
+    """
+    Like `django.core.wsgi.get_wsgi_application`, with the lean path for API
+    requests unless `API_MIDDLEWARE` is `None`.
+    """
+    django.setup(set_prefix=False)
+    full = WSGIHandler()
+    if getattr(settings, 'API_MIDDLEWARE', None) is None:
+        return full
+    prefixes = getattr(settings, 'FULL_MIDDLEWARE_PREFIXES', ('/admin',))
+    return PrefixDispatcher(LeanWSGIHandler(), full, prefixes)
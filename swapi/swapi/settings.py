@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'swapi.urls'
@@ -119,3 +120,124 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Base of the resource URLs in API responses. Set it to `None` to build them
+# from the host of each request instead (e.g. behind a proxy).
+
+SWAPI_BASE_URL = 'http://localhost:8000'
+
+
+# Server-Sent Events for `People` changes
+
+PEOPLE_EVENTS_QUEUE_SIZE = 100  # per subscriber, before it gets evicted
+
+PEOPLE_EVENTS_HISTORY_SIZE = 1000  # events kept for `Last-Event-ID` resume
+
+PEOPLE_EVENTS_HEARTBEAT = 15  # seconds
+
+
+# Batch reads and multiplexed requests
+
+PEOPLE_MAX_BATCH_IDS = 500  # ids accepted by `/people/?ids=`
+
+BATCH_MAX_REQUESTS = 50  # sub-requests accepted by `/batch/`
+
+
+# Rate limiting and write admission control
+
+RATELIMIT_ENABLED = True
+
+# Token buckets as (tokens per second, burst size), per client and per route
+RATELIMIT_RULES = {
+    'people': {
+        'client': (10, 100),
+        'route': (100, 200),
+    },
+    'jobs': {
+        'client': (0.1, 5),
+        'route': (1, 20),
+    },
+}
+
+RATELIMIT_CACHE = None  # a `CACHES` alias to share buckets between processes
+
+RATELIMIT_TRUST_X_FORWARDED_FOR = False
+
+RATELIMIT_WRITE_CONCURRENCY = 1  # concurrent writes admitted per process
+
+RATELIMIT_WRITE_QUEUE_TIMEOUT = 0.5  # seconds a write waits for a slot
+
+
+# Idempotency keys for POST requests
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds a stored response is replayed
+
+IDEMPOTENCY_MAX_KEYS = 10000
+
+IDEMPOTENCY_WAIT_TIMEOUT = 5  # seconds a duplicate waits for the original
+
+
+# In-memory columnar copy of `People` serving GET requests without the ORM
+
+PEOPLE_READ_MODEL = False
+
+PEOPLE_READ_MODEL_MAX_AGE = 60  # seconds before reloading, `None` for never
+
+
+# Lean request path for the API (see `swapi.handlers`). Requests under
+# `FULL_MIDDLEWARE_PREFIXES` get `MIDDLEWARE` and `ROOT_URLCONF`, all others
+# only `API_MIDDLEWARE` and `API_URLCONF`. Set `API_MIDDLEWARE = None` to run
+# everything through the full stack.
+
+API_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'api.profiling.ProfilingMiddleware',
+]
+
+API_URLCONF = 'swapi.api_urls'
+
+FULL_MIDDLEWARE_PREFIXES = ('/admin',)
+
+
+# Request profiling (see `api.profiling`). Staff users profile a request with
+# an `X-Profile: pstats|speedscope` header or `?_profile=` parameter.
+
+PROFILING_ENABLED = False
+
+PROFILING_SAMPLE_RATE = 0  # fraction of all requests profiled automatically
+
+PROFILING_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+PROFILING_BUFFER_SIZE = 100  # reports kept for `/profiles/`
+
+PROFILING_DIR = None  # also write every report to this directory
+
+
+# Background jobs, run by `manage.py run_jobs` (see `api.jobs`)
+
+JOBS_CONCURRENCY = 2  # jobs run at the same time, each in its own process
+
+JOBS_MAX_ATTEMPTS = 3
+
+JOBS_RETRY_DELAY = 10  # seconds before the first retry, doubled for each next one
+
+JOBS_POLL_INTERVAL = 1  # seconds
+
+JOBS_RESULT_DIR = os.path.join(BASE_DIR, 'job_results')
+
+JOBS_RESULT_TTL = 24 * 60 * 60  # seconds result files are kept, None for ever
+
+JOBS_MAX_PENDING = 10  # per kind, more are rejected with a 429
+
+
+# Request deadlines (see `api.deadlines`), as (default, maximum) seconds per
+# route. Clients can pick a timeout up to the maximum with `X-Request-Timeout`.
+
+DEADLINES = {
+    'people': (5, 30),
+    'planets': (5, 30),
+}
+
+DEADLINE_MIN = 0.05  # shortest timeout a client can ask for
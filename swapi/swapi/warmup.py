@@ -0,0 +1,43 @@
+"""
+Work done once before serving, so that with a preloading server (see
+`gunicorn_conf.py`) it happens in the master and is shared by every worker
+instead of being paid by the first request each worker handles.
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.urls import get_resolver
+
+
+def warmup():
+    """
+    Populate the URL resolvers and model metadata caches and load the
+    `People` read model, if enabled. Returns the seconds spent on each step,
+    by name.
+    """
+    # Models can't be imported before `django.setup()`
+    from api.readmodel import get_read_model
+
+    timings = {}
+
+    start = time.perf_counter()
+    for urlconf in {settings.ROOT_URLCONF, getattr(settings, 'API_URLCONF', settings.ROOT_URLCONF)}:
+        # Imports every urls module and compiles every pattern
+        get_resolver(urlconf).reverse_dict
+    timings['urls'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for model in apps.get_models():
+        opts = model._meta
+        opts.get_fields()
+        opts.concrete_fields
+        opts.related_objects
+        opts.fields_map
+    timings['models'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_read_model()
+    timings['read_model'] = time.perf_counter() - start
+
+    return timings
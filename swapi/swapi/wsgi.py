@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/2.0/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+# API requests skip the middleware only the admin needs, see `swapi.handlers`
+from swapi.handlers import get_wsgi_application
+from swapi.warmup import warmup
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "swapi.settings")
 
 application = get_wsgi_application()
+
+# Fill the URL and model caches and load the People read model now rather
+# than on the first request. Under `gunicorn_conf.py` this runs once, in the
+# master, before the workers are forked.
+startup_timings = warmup()